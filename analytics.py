@@ -0,0 +1,133 @@
+"""
+A module for reporting on the ratings and years of the
+movies in a storage: percentiles, histograms by rating
+band, averages per decade and the correlation between
+rating and year.
+
+The ratings and years are loaded once into contiguous
+NumPy arrays, and every aggregate is computed on the
+whole arrays at once instead of looping over movies.
+The arrays are saved next to the database file (a
+columnar snapshot), and reused while the database
+doesn't change.
+"""
+
+import numpy as np
+
+PERCENTS = (10, 25, 50, 75, 90)
+
+
+def _snapshot_path(storage):
+    """
+    Returns the path of the columnar snapshot of a
+    storage, next to its file.
+    """
+    return storage.file_path + ".columns.npz"
+
+
+def load_columns(storage):
+    """
+    Returns a tuple of NumPy arrays (ratings, years) with
+    the rating and year of every movie in storage, any
+    IStorage subclass, leaving out the movies without
+    rating or year.
+
+    Reads them from the columnar snapshot when it was
+    saved for the current version of the database file,
+    otherwise builds them with iter_movies() and saves a
+    new snapshot.
+    """
+    signature = str(storage.data_signature())
+    snapshot_path = _snapshot_path(storage)
+    try:
+        with np.load(snapshot_path) as snapshot:
+            if str(snapshot["signature"]) == signature:
+                return snapshot["ratings"], snapshot["years"]
+    except (OSError, KeyError, ValueError):
+        pass
+
+    count = storage.count()
+    ratings = np.empty(count, dtype=np.float64)
+    years = np.empty(count, dtype=np.int32)
+    size = 0
+    for _, attributes in storage.iter_movies():
+        if size == count: ## the database grew while reading it
+            break
+        if attributes["rating"] is None or attributes["year"] is None:
+            continue
+        ratings[size] = attributes["rating"]
+        years[size] = attributes["year"]
+        size += 1
+    ratings, years = ratings[:size], years[:size]
+
+    try:
+        with open(snapshot_path, mode="wb") as handle:
+            np.savez(handle, ratings=ratings, years=years,
+                     signature=np.array(signature))
+    except OSError as e:
+        print(f"Snapshot wasn't saved: {e}")
+    return ratings, years
+
+
+def rating_percentiles(ratings, percents=PERCENTS):
+    """
+    Returns a dictionary where keys = percents,
+    values = the rating below which that percent of the
+    ratings fall (linear interpolation).
+    """
+    if ratings.size == 0:
+        return {}
+    return dict(zip(percents,
+                    np.percentile(ratings, percents).round(2).tolist()))
+
+
+def rating_histogram(ratings):
+    """
+    Returns a dictionary where keys = rating bands
+    ("0-1", "1-2", ..., "9-10"), values = number of movies
+    with a rating in that band. The last band includes 10.
+    """
+    counts, edges = np.histogram(ratings, bins=np.arange(0, 11))
+    return {f"{int(low)}-{int(high)}": int(count)
+            for low, high, count in zip(edges[:-1], edges[1:], counts)}
+
+
+def decade_averages(ratings, years):
+    """
+    Returns a dictionary where keys = decades (1970,
+    1980, ...), values = average rating of the movies
+    released in that decade.
+    """
+    if ratings.size == 0:
+        return {}
+    decades, positions = np.unique(years // 10 * 10, return_inverse=True)
+    sums = np.bincount(positions, weights=ratings)
+    counts = np.bincount(positions)
+    return dict(zip(decades.tolist(), (sums / counts).round(2).tolist()))
+
+
+def rating_year_correlation(ratings, years):
+    """
+    Returns the Pearson correlation between rating and
+    year, between -1 and 1, or None when it can't be
+    computed (less than two movies, or every movie with
+    the same rating or year).
+    """
+    if ratings.size < 2 or ratings.std() == 0 or years.std() == 0:
+        return None
+    return round(float(np.corrcoef(ratings, years)[0, 1]), 3)
+
+
+def ratings_report(storage):
+    """
+    Computes every aggregate for storage, any IStorage
+    subclass. Returns a dictionary with the "count",
+    "percentiles", "histogram", "decades" and
+    "correlation".
+    """
+    ratings, years = load_columns(storage)
+    return {"count": int(ratings.size),
+            "percentiles": rating_percentiles(ratings),
+            "histogram": rating_histogram(ratings),
+            "decades": decade_averages(ratings, years),
+            "correlation": rating_year_correlation(ratings, years)}
@@ -2,13 +2,174 @@
 A module for extracting movie data from OMDb API,
 The Open Movie Database https://www.omdbapi.com/
 a RESTful web service to obtain movie information.
+
+Requests share a pool of keep-alive connections.
+get_many_movie_data() fetches many titles concurrently
+from asyncio code, get_new_movie_data() fetches one.
 """
 
 import os
 import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests as req
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 import urllib3.exceptions
+from omdb_cache import ResponseCache
+from rate_limiter import ApiKeyPool, backoff_delay
+
+OMDB_URL = "https://www.omdbapi.com/"
+REQUEST_TIMEOUT = 10 # seconds
+POOL_SIZE = 32
+REQUESTS_PER_SECOND = 10
+DAILY_QUOTA = 1000 # requests per day for a free OMDb key
+MAX_RETRIES = 4
+KEY_COOLDOWN = 3600 # seconds a rejected key is skipped
+MAX_RETRY_AFTER = 60 # longer Retry-After times skip the key instead
+
+load_dotenv()
+_session = None
+_session_lock = threading.Lock()
+
+# Found movies are cached for a week, missing ones for a day
+response_cache = ResponseCache(os.path.join("data", "omdb_cache.json"),
+                               ttl=7 * 24 * 3600,
+                               negative_ttl=24 * 3600,
+                               max_entries=10000)
+
+
+def _load_api_keys():
+    """
+    Reads the OMDb API keys from the environment (or the
+    .env file): a comma separated list in "my_api_keys",
+    or a single key in "my_api_key".
+    Returns a list of keys, empty if none is set.
+    """
+    api_keys = os.getenv("my_api_keys") or os.getenv("my_api_key") or ""
+    return [api_key.strip() for api_key in api_keys.split(",")
+            if api_key.strip()]
+
+
+key_pool = ApiKeyPool(_load_api_keys(), "data",
+                      daily_limit=DAILY_QUOTA,
+                      requests_per_second=REQUESTS_PER_SECOND,
+                      cooldown=KEY_COOLDOWN)
+
+
+def _retry_after(response):
+    """
+    Returns the Retry-After time of response in seconds,
+    or None when it has none (or it is a date).
+    """
+    retry_after = response.headers.get("Retry-After", "").strip()
+    return float(retry_after) if retry_after.isdigit() else None
+
+
+def _rejection(response):
+    """
+    Tells why OMDb rejected a request, returns:
+    - None when it wasn't rejected
+    - "throttled" for a transient HTTP 429 (too many
+    requests per second), the key can be used again after
+    a short wait
+    - "limit" when the key reached its request limit
+    (HTTP 401 with "Request limit reached!", or a 429
+    asking to wait more than MAX_RETRY_AFTER seconds)
+    - "invalid" for any other HTTP 401, like an invalid
+    API key
+    """
+    if response.status_code == 429:
+        retry_after = _retry_after(response)
+        if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+            return "limit"
+        return "throttled"
+    if response.status_code == 401:
+        return "limit" if "limit" in response.text.lower() else "invalid"
+    return None
+
+
+def _send_request(params):
+    """
+    Sends a request to OMDb through the shared session,
+    with an API key from key_pool, which paces requests
+    and counts them in the key's daily quota.
+
+    When OMDb throttles the key (HTTP 429), slows it
+    down and retries with it. When it rejects the key
+    (request limit reached or invalid key), marks it as
+    exhausted and retries with another key. Up to
+    MAX_RETRIES times, waiting an exponential backoff with
+    jitter (or the Retry-After time) between attempts.
+
+    Returns the response, or None when there is no key
+    left to use.
+    """
+    response = None
+    for attempt in range(MAX_RETRIES + 1):
+        entry = key_pool.acquire()
+        if entry is None:
+            if len(key_pool) == 0:
+                print("Check if the API key 'my_api_key' is set "
+                      "in your environment variables.")
+            else:
+                print("Every OMDb API key reached its limit, "
+                      "try again later.")
+            return response
+
+        response = _get_session().get(OMDB_URL,
+                                      params={**params,
+                                              "apikey": entry["key"]},
+                                      timeout=REQUEST_TIMEOUT)
+        rejection = _rejection(response)
+        if rejection is None:
+            entry["bucket"].speed_up()
+            return response
+
+        if rejection == "throttled":
+            key_pool.mark_throttled(entry)
+        elif rejection == "limit":
+            key_pool.mark_exhausted(entry)
+        else: ## invalid key, skip it for the rest of the day
+            key_pool.mark_exhausted(entry, cooldown=24 * 3600)
+        if attempt == MAX_RETRIES:
+            return response
+
+        retry_after = _retry_after(response)
+        delay = (retry_after if rejection == "throttled"
+                 and retry_after is not None else backoff_delay(attempt))
+        print(f"OMDb API key {entry['name']} rejected, "
+              f"retrying in {delay:.1f} seconds")
+        time.sleep(delay)
+    return response
+
+
+def key_usage():
+    """
+    Returns a list with the usage of each OMDb API key,
+    see ApiKeyPool.usage().
+    """
+    return key_pool.usage()
+
+
+def _get_session():
+    """
+    Returns the requests Session shared by every request,
+    creating it the first time. Its connection pool keeps
+    up to POOL_SIZE connections to OMDb alive, so requests
+    don't open a new TCP/TLS connection each time.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = req.Session()
+            adapter = HTTPAdapter(pool_connections=1,
+                                  pool_maxsize=POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
 
 
 def _get_movie_rating(movie_info):
@@ -39,6 +200,7 @@ def _get_movie_rating(movie_info):
             except (ValueError, IndexError):
                 print("IMDb rating not found.")
                 return 0.0
+    return 0.0
 
 
 def _get_movie_info(movie_title):
@@ -47,29 +209,40 @@ def _get_movie_info(movie_title):
     on the provided movie title.
 
     This function makes a request to the OMDb API using
-    the given movie title and your API key.
+    the given movie title and your API key, through
+    _send_request(), waiting at most REQUEST_TIMEOUT seconds.
     It parses the JSON response into a Python dictionary
     containing movie attributes.
 
+    Responses are looked up first in response_cache, and
+    stored in it afterwards, including "Movie not found!".
+
     :param movie_title: The title of the movie to look for.
     Returns a dictionary containing movie attributes if
     found, or an empty dictionary if not found or an
     error occurs.
     """
-    load_dotenv()
-    api_key = os.getenv("my_api_key")
-    url = f"https://www.omdbapi.com/?t={movie_title}&apikey={api_key}"
+    cached_info = response_cache.get_title(movie_title)
+    if cached_info is not None:
+        return cached_info
+
+    params = {"t": movie_title}
 
     try:
-        response = req.get(url)
+        response = _send_request(params)
+        if response is None:
+            return {}
         response.raise_for_status() # handle bad responses
-        print(f"Requesting '{movie_title}' to {url}")
+        print(f"Requesting '{movie_title}' to {response.url}")
         json_string = response.text
         movie_info_dict = json.loads(json_string)
         if "Movie not found!" in json_string:
             print(json_string)
+            response_cache.put(movie_title, {})
             return {}
 
+        if "Title" in movie_info_dict:
+            response_cache.put(movie_title, movie_info_dict)
         return movie_info_dict
 
     except NameError as e:
@@ -80,7 +253,8 @@ def _get_movie_info(movie_title):
         print("Check if the API key 'my_api_key' is set "
               "in your environment variables.")
     except req.exceptions.Timeout:
-        print(f"Request timed out after 10 seconds for '{movie_title}'.")
+        print(f"Request timed out after {REQUEST_TIMEOUT} seconds "
+              f"for '{movie_title}'.")
     except req.exceptions.ConnectionError as e:
         if isinstance(e.args[0], urllib3.exceptions.NameResolutionError):
             print(f"Name Resolution Error: {e}")
@@ -95,6 +269,35 @@ def _get_movie_info(movie_title):
     return {}
 
 
+def _parse_movie_data(movie_info):
+    """
+    Extracts the title, IMDb rating, year, and poster URL
+    from the movie information returned by OMDb.
+
+    Returns a tuple (title, attributes), where attributes
+    is a dict with 'rating', 'year' and 'poster'.
+    Returns None if movie_info is empty or incomplete.
+    """
+    if not movie_info:
+        return None
+    try:
+        title = str(movie_info.get("Title"))
+        rating = _get_movie_rating(movie_info)
+        year = int(movie_info.get("Year"))
+        poster_url = movie_info.get("Poster")
+
+        new_movie_dict = {'rating': rating,
+                          'year': year,
+                          'poster': poster_url}
+        return title, new_movie_dict
+    except (TypeError, ValueError) as e:
+        print(e)
+        return None
+    except UnboundLocalError as e:
+        print(e)
+        return None
+
+
 def get_new_movie_data(movie_title):
     """
     Fetches and formats movie data from the OMDb API.
@@ -102,29 +305,54 @@ def get_new_movie_data(movie_title):
     This function takes a movie title, fetches movie
     information using _get_movie_info(), extracts the
     IMDb rating, year, and poster URL.
-    If the title contains spaces, replaces them with
-    "+".
-    Returns a dictionary containing the extracted
-    info as a dict of attributes.
-    Returns an empty dictionary if any error occurs
-    or if movie data is not found.
-    """
-    title = movie_title.replace(" ", "+")
-    movie_info = _get_movie_info(title)
-    if movie_info != {}:
+    Returns a tuple (title, attributes) with the
+    extracted info as a dict of attributes.
+    Returns None if any error occurs or if movie data
+    is not found.
+    """
+    new_movie_data = _parse_movie_data(_get_movie_info(movie_title))
+    response_cache.flush()
+    return new_movie_data
+
+
+def cache_stats():
+    """
+    Returns a dictionary with the number of "hits",
+    "misses" and "entries" of the OMDb response cache.
+    """
+    return response_cache.stats()
+
+
+async def get_many_movie_data(movie_titles, concurrency=8):
+    """
+    Fetches and formats the data of many movies from the
+    OMDb API, with at most concurrency requests at the
+    same time, all of them sharing the connection pool
+    and the response cache.
+
+    An asynchronous generator: yields tuples
+    (movie_title, result) as soon as each request
+    completes, where result is what get_new_movie_data()
+    returns for movie_title. For example:
+        async for title, result in get_many_movie_data(titles):
+            ...
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        async def fetch(movie_title):
+            async with semaphore:
+                movie_info = await loop.run_in_executor(
+                    executor, _get_movie_info, movie_title)
+            return movie_title, _parse_movie_data(movie_info)
+
+        tasks = [asyncio.ensure_future(fetch(movie_title))
+                 for movie_title in movie_titles]
         try:
-            title = str(movie_info.get("Title"))
-            rating = _get_movie_rating(movie_info)
-            year = int(movie_info.get("Year"))
-            poster_url = movie_info.get("Poster")
-
-            new_movie_dict = {'rating': rating,
-                              'year': year,
-                              'poster': poster_url}
-            return title, new_movie_dict
-        except TypeError as e:
-            print(e)
-            return {}
-        except UnboundLocalError as e:
-            print(e)
-            return {}
+            for next_completed in asyncio.as_completed(tasks):
+                yield await next_completed
+        finally:
+            for task in tasks:
+                task.cancel()
+            response_cache.flush()
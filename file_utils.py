@@ -0,0 +1,101 @@
+"""
+A module with the file operations shared by the rest of
+the program: writing a file without ever leaving it half
+written, saving a json file, and telling whether a file
+changed.
+
+Every function raises OSError when the file can't be
+written, after removing the temporary file it wrote, so
+the caller decides what a failure means (a cache that
+isn't saved prints a message, a website that isn't
+generated stops the command).
+"""
+
+import os
+import json
+import threading
+
+
+def file_signature(file_path):
+    """
+    Returns a tuple (mtime, size) describing the file at
+    file_path, or None when it doesn't exist. A different
+    signature means the file was changed.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class AtomicWriter:
+    """
+    Writes a file next to file_path (file_path + a
+    process and thread id + ".tmp"), and replaces
+    file_path with it when it is complete, so nobody ever
+    reads a half written file:
+
+        with AtomicWriter(file_path) as handle:
+            handle.write(content)
+
+    The file is opened in mode (binary by default). When
+    the block raises, or discard() was called in it,
+    file_path is left as it was and the temporary file is
+    removed.
+    """
+    def __init__(self, file_path, mode="wb", encoding=None):
+        self.file_path = file_path
+        self.temporary_path = (f"{file_path}.{os.getpid()}."
+                               f"{threading.get_ident()}.tmp")
+        self.mode = mode
+        self.encoding = encoding
+        self.handle = None
+        self.discarded = False
+
+
+    def discard(self):
+        """
+        Keeps the old file: the temporary file won't
+        replace it.
+        """
+        self.discarded = True
+
+
+    def __enter__(self):
+        self.handle = open(self.temporary_path, mode=self.mode,
+                           encoding=self.encoding)
+        return self.handle
+
+
+    def __exit__(self, exception_type, exception, traceback):
+        try:
+            self.handle.close()
+            if exception_type is None and not self.discarded:
+                os.replace(self.temporary_path, self.file_path)
+        finally:
+            if os.path.exists(self.temporary_path):
+                os.remove(self.temporary_path)
+        return False
+
+
+def write_atomically(file_path, content):
+    """
+    Writes content (bytes) to file_path with an
+    AtomicWriter.
+    """
+    with AtomicWriter(file_path) as handle:
+        handle.write(content)
+
+
+def save_json(file_path, data, **options):
+    """
+    Writes data to the json file file_path with an
+    AtomicWriter, creating its folder if needed. options
+    are passed to json.dump() (e.g. indent=2).
+    """
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with AtomicWriter(file_path, mode="w", encoding="utf-8") as handle:
+        json.dump(data, handle, **options)
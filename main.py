@@ -1,21 +1,41 @@
 """
 This program prints a user CLI, which instantiates
-a Storage manager subclass for a json or csv file
-database, with CRUD methods.
+a Storage manager subclass for a json, csv, SQLite
+or binary file database, with CRUD methods.
 
 With that object instantiates and runs a MovieApp,
 which contains methods for processing, formating
 and printing the extracted data, and calling the
 methods from Storage.
+
+The storage can be selected from the command line:
+    python main.py [json|csv|csv-journal|sqlite|binary]
+JSON is used by default. csv-journal uses the same csv file
+in journaled mode: each change is appended to a journal
+instead of rewriting the whole file.
 """
 
+import sys
 from movie_app import MovieApp
+from storage.storage_binary import StorageBinary
 from storage.storage_csv import StorageCsv
 from storage.storage_json import StorageJson
+from storage.storage_sqlite import StorageSqlite
 
 
 if __name__ == "__main__":
-    storage_json = StorageJson('data/movies.json')
-    storage_csv = StorageCsv('data/movies.csv')
-    movies_app = MovieApp(storage_json)
+    storages = {
+        "json": lambda: StorageJson('data/movies.json'),
+        "csv": lambda: StorageCsv('data/movies.csv'),
+        "csv-journal": lambda: StorageCsv('data/movies.csv', journaled=True),
+        "sqlite": lambda: StorageSqlite('data/movies.sqlite'),
+        "binary": lambda: StorageBinary('data/movies.bin'),
+    }
+    storage_name = sys.argv[1].lower() if len(sys.argv) > 1 else "json"
+    if storage_name not in storages:
+        print(f"Unknown storage '{storage_name}', "
+              f"choose one of: {', '.join(storages)}")
+        sys.exit(1)
+
+    movies_app = MovieApp(storages[storage_name]())
     movies_app.run()
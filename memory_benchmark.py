@@ -0,0 +1,99 @@
+"""
+This program compares the memory taken by the in-memory
+copy of a movie database: the dictionary of dictionaries
+json.load() returns, and the MovieCatalog the storages
+keep instead.
+
+The movies are generated, with titles, ratings, years
+and OMDb-like posters, as new objects for every movie,
+like a parser creates them.
+
+It can run independently of main:
+    python memory_benchmark.py [--movies 1000000]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from storage.catalog import MovieCatalog, POSTER_PREFIX, POSTER_SUFFIX
+
+MOVIES = 1_000_000
+LOOKUPS = 100_000
+
+
+def generate_movies(count):
+    """
+    Yields count tuples (title, attributes), with a new
+    string, float and int for every field, like the ones
+    json.load() returns.
+    """
+    for number in range(count):
+        poster = (f"{POSTER_PREFIX}MV5B{number:012d}"
+                  f"XkEyXkFqcGc@{POSTER_SUFFIX}"
+                  if number % 10 else "N/A")
+        yield f"Movie number {number}", {
+            "rating": float(f"{number % 100 / 10:.1f}"),
+            "year": int(str(1900 + number % 125)),
+            "poster": poster}
+
+
+def measure(build):
+    """
+    Returns a tuple (movies, bytes, seconds): what build()
+    returns, the memory it still takes and the time it
+    took to build it.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    movies = build()
+    seconds = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return movies, size, seconds
+
+
+def lookup_seconds(movies, count):
+    """
+    Returns the time taken to read the rating, year and
+    poster of LOOKUPS movies.
+    """
+    start = time.perf_counter()
+    for number in range(0, count, max(1, count // LOOKUPS)):
+        attributes = movies[f"Movie number {number}"]
+        attributes["rating"], attributes["year"], attributes["poster"]
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Parses the command line arguments, builds both
+    representations one after the other, and prints the
+    memory and time each one takes.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare the memory of movie representations.")
+    parser.add_argument("--movies", type=int, default=MOVIES,
+                        help="number of movies to generate")
+    args = parser.parse_args()
+
+    results = []
+    for name, build in (
+            ("dict of dicts", lambda: dict(generate_movies(args.movies))),
+            ("MovieCatalog", lambda: MovieCatalog(generate_movies(args.movies)))):
+        movies, size, seconds = measure(build)
+        lookups = lookup_seconds(movies, args.movies)
+        results.append((name, size))
+        print(f"{name:>14}: {size / 2 ** 20:8.1f} MiB, "
+              f"{size / args.movies:6.1f} bytes/movie, "
+              f"built in {seconds:.2f}s, lookups in {lookups:.2f}s")
+        del movies
+
+    (_, dict_size), (_, catalog_size) = results
+    print(f"MovieCatalog takes {catalog_size / dict_size:.0%} of the memory "
+          f"of the dict of dicts for {args.movies} movies")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,12 @@ with operations the user can perform on data retrieved
 from a movie database and a movie API.
 """
 
-import sys
 import os
-import statistics
-import random
+import sys
+import analytics
+import poster_mirror
+import static_assets
+import website_generator
 
 
 class MovieApp:
@@ -17,13 +19,15 @@ class MovieApp:
     The MovieApp class will have a member (field)
     from the type IStorage.
     """
+    PAGE_SIZE = 20 # movies per page in sorted listings
+
     def __init__(self, storage):
         self._storage = storage
 
 
     def _command_list_movies(self): # menu command 1
         """
-        Fetches the data from the database as a dictionary
+        Iterates through the movies in the database.
         Handles cases in which the csv file could be corrupt
         or wrongly formated.
 
@@ -33,13 +37,13 @@ class MovieApp:
             Titanic (1999): 9
         """
         try:
-            movies_dict = self._storage.read_movies()
+            movies_count = self._storage.count()
 
-            print(f"{len(movies_dict)} movie(s) in total")
-            if len(movies_dict) < 1:
+            print(f"{movies_count} movie(s) in total")
+            if movies_count < 1:
                 print("Please, add movies to the database")
 
-            for title, attributes in movies_dict.items():
+            for title, attributes in self._storage.iter_movies():
                 print(f"{title} ({attributes['year']}):"
                       f" {attributes['rating']}")
 
@@ -47,106 +51,99 @@ class MovieApp:
             print("Data base might be currently empty or corrupted: ", e)
 
 
-    def __get_rated_movies(self):
-        """
-        A utility command for extracting all the titles and ratings
-        from the movie database.
-        Returns a list with tuples (rating, title).
-        """
-        movies_dict = self._storage.read_movies()
-
-        rated_movies = [(movie_attributes['rating'], movie_title)
-                        for movie_title, movie_attributes in movies_dict.items()]
-
-        return rated_movies
-
-
     def _command_movie_stats(self): # menu command 5
         """
         Calculates and print statistics about the movies in
         the database: average rating, median rating, titles
         with the highest and lowest rating.
 
-        - Fetches the data from the database as a dictionary
-
-        - Calculates and prints average and median ratings
         1. Informs the user when there are no stats to show
-        2. Makes a list with all the ratings in the database
-        3. Prints the average and median averages in the database
-
-        - Calculates highest and lowest ratings,
-        prints movie(s) with highest and lower rating
-        4. Calls __get_rated_movies() to get a list of
-        tuples containing movie titles and their ratings
-        Sorts the list of tuples from lowest to highest rating
-        5. Finds the highest and lowest rating from the sorted
-        list
-        Makes a list with movie(s) matching the highest rating,
-        and a list with movie(s) matching the lowest rating
-        6. Prints the movie(s) in those lists formated as strings
+        2. Asks the storage for the average and median
+        ratings, and prints them
+        3. Asks the storage for the highest and lowest
+        ratings, and the movie(s) that share each of them
+        4. Prints the movie(s) formated as strings
         (all the movies that share that rating if there is more
         than one)
         """
-        movies_dict = self._storage.read_movies()
-
         ## Step 1
-        if len(movies_dict) < 1:
+        if self._storage.count() < 1:
             print("Currently there are no movies in the database.")
             return
 
         ## Step 2
-        ratings = [movie['rating'] for movie in movies_dict.values()]
-
-        ## Step 3
-        average_rating = round(statistics.mean(ratings), 2)
+        average_rating = round(self._storage.average_rating(), 2)
         print(f"\nAverage rating: {average_rating}")
-        median_rating = round(statistics.median(ratings), 2)
+        median_rating = round(self._storage.median_rating(), 2)
         print(f"Median rating: {median_rating}")
 
-        ## Step 4
-        rated_movies = self.__get_rated_movies()
-        if not rated_movies:
+        ## Step 3
+        extremes = self._storage.rating_extremes()
+        if extremes is None:
             print("No rated movies found.")
             return
-        sorted_rated_movies = sorted(rated_movies,
-                                      key=lambda rating: rating[0])
-
-        ## Step 5
-        best_rating = sorted_rated_movies[-1][0]
-        best_movies = [movie for movie in rated_movies if movie[0] == best_rating]
-        worst_rating = sorted_rated_movies[0][0]
-        worst_movies = [movie for movie in rated_movies if movie[0] == worst_rating]
-
-        ## Step 6
-        for extremes, movies in [("Best", best_movies), ("Worst", worst_movies)]:
-            if len(movies) == 1:
-                print(f"{extremes} movie: {movies[0][1]}, {movies[0][0]}")
+        (best_rating, best_titles), (worst_rating, worst_titles) = extremes
+
+        ## Step 4
+        for extreme, rating, titles in [("Best", best_rating, best_titles),
+                                        ("Worst", worst_rating, worst_titles)]:
+            if len(titles) == 1:
+                print(f"{extreme} movie: {titles[0]}, {rating}")
             else: ##  When more than one movie has that rating
-                output_string = f"{extremes} movies: "
-                for rating, title in movies:
+                output_string = f"{extreme} movies: "
+                for title in titles:
                     output_string += f"{title}, {rating}, "
                 print(output_string[:-2])
 
 
+    def _command_detailed_stats(self): # menu command 11
+        """
+        Prints a report about the ratings and years of the
+        movies in the database, computed by the analytics
+        module: rating percentiles, number of movies per
+        rating band, average rating per decade, and the
+        correlation between rating and year.
+        """
+        if self._storage.count() < 1:
+            print("Currently there are no movies in the database.")
+            return
+
+        report = analytics.ratings_report(self._storage)
+
+        print(f"\n{report['count']} movie(s)")
+        print("Rating percentiles:")
+        for percent, rating in report["percentiles"].items():
+            print(f"  {percent}%: {rating}")
+        print("Movies per rating band:")
+        for band, count in report["histogram"].items():
+            print(f"  {band}: {count}")
+        print("Average rating per decade:")
+        for decade, rating in report["decades"].items():
+            print(f"  {decade}s: {rating}")
+        correlation = report["correlation"]
+        print("Correlation between rating and year: "
+              f"{'not enough data' if correlation is None else correlation}")
+
+
     def _command_random_movie(self): # menu command 6
         """
         Prints the title and rating of a random movie
         from the database.
 
-        - Calls __get_rated_movies() to get a list of
-        tuples containing movie titles and their ratings
-        - Randomly chooses a tuple from the list
-        - Prints the tuple formated as a string
+        - Asks the user whether better rated movies should
+        come up more often
+        - Asks the storage for a random movie
+        - Prints it formated as a string
         """
-        if len(self._storage.read_movies()) < 1:
+        weighted = input("Favor better rated movies? Y/N: ").lower() == "y"
+        random_movie = self._storage.random_movie(weighted)
+        if random_movie is None:
             print("Currently there are no movies in the database.")
             return
 
-        rated_movies = self.__get_rated_movies()
-        random_movie = random.choice(rated_movies)
-
-        print(f"Your movie for tonight:. {random_movie[1]}, "
-              f"it's rated {random_movie[0]}")
+        title, attributes = random_movie
+        print(f"Your movie for tonight:. {title}, "
+              f"it's rated {attributes['rating']}")
 
 
     def _command_search_movie(self): # menu command 7
@@ -155,82 +152,194 @@ class MovieApp:
         and then searches all the movies in the database.
         Prints all the movies that matched the user’s query,
         along with the rating. If there is no match it will
-        print a message informing the user.
+        print a message informing the user, followed by the
+        most similar titles (fuzzy search, tolerates typos)
+        ranked by their similarity score.
         """
-        rated_movies = self.__get_rated_movies()
-        search_term = input("Enter part of movie name: ").lower()
-        match_found = False
+        search_term = input("Enter part of movie name: ")
+        matches = self._storage.search(search_term)
 
-        matches = [(rating, title) for (rating, title) in rated_movies if
-                 search_term in title.lower()]
+        for title, attributes in matches:
+            print(f"{title}, {attributes['rating']}")
 
-        if matches:
-            for rating, title in matches:
-                print(f"{title}, {rating}")
-                match_found = True
-
-        if not match_found:
+        if not matches:
             print("Movie matching search term not found")
+            similar_movies = self._storage.fuzzy_search(search_term, k=5)
+            if similar_movies:
+                print("Did you mean:")
+            for title, attributes, score in similar_movies:
+                print(f"{title}, {attributes['rating']} "
+                      f"(similarity {score})")
 
 
     def _command_sort_by_rating(self): # menu command 8
         """
-        Fetches and sorts movies sorted by descending rating.
-        Prints all the movies and their ratings, in descending
-        order by the rating.
+        Fetches movies sorted by descending rating, a page
+        of PAGE_SIZE movies at a time.
+        Prints the movies and their ratings, in descending
+        order by the rating, and asks the user whether to
+        print the next page.
         """
-        if len(self._storage.read_movies()) < 1:
+        movies_count = self._storage.count()
+        if movies_count < 1:
             print("Currently there are no movies in the database.")
             return
 
-        rated_movies = self.__get_rated_movies()
+        for offset in range(0, movies_count, self.PAGE_SIZE):
+            if offset > 0:
+                option = input(f"Showing {offset} of {movies_count}, "
+                               f"press enter for more or Q to stop: ")
+                if option.lower() == "q":
+                    return
+            for title, attributes in self._storage.movies_by_rating(
+                    offset, self.PAGE_SIZE):
+                print(f"{title}: {attributes['rating']}")
 
-        movies_sorted_desc_rating = sorted(rated_movies,
-                                           key=lambda movies: movies[0],
-                                           reverse=True)
 
-        for rating, title in movies_sorted_desc_rating:
-            print(f"{title}: {rating}")
+    @staticmethod
+    def _ask_range(prompt, cast):
+        """
+        A utility command for _command_filter_movies().
+        Asks the user for a range "low-high", a single
+        value, or an open range "low-" or "-high", and
+        converts the bounds with cast (int or float).
+        Returns a tuple (low, high), or None when the user
+        leaves it empty. Asks again when it is invalid.
+        """
+        while True:
+            user_input = input(prompt).strip()
+            if not user_input:
+                return None
+            low, separator, high = user_input.partition("-")
+            try:
+                low = cast(low) if low.strip() else float("-inf")
+                if not separator:
+                    high = low
+                else:
+                    high = cast(high) if high.strip() else float("inf")
+            except ValueError:
+                print("Please enter a valid range: low-high, low-, -high or a value")
+                continue
+            if low > high:
+                print("The lower bound can't be greater than the upper one")
+                continue
+            return low, high
+
+
+    def _command_filter_movies(self): # menu command 12
+        """
+        Asks the user for a range of years, a range of
+        ratings and a part of the movie name, each one
+        optional, and prints the movies matching all of
+        them as they are found, followed by their number,
+        example:
+            The Godfather (1972): 9.2
+            1 movie(s) found
+        """
+        years = self._ask_range("Enter years (e.g. 1970-1979), "
+                                "leave empty for any: ", int)
+        ratings = self._ask_range("Enter ratings (e.g. 8-10), "
+                                  "leave empty for any: ", float)
+        title = input("Enter part of movie name, leave empty for any: ")
+
+        found = 0
+        for movie_title, attributes in self._storage.filter_movies(
+                years, ratings, title or None):
+            print(f"{movie_title} ({attributes['year']}):"
+                  f" {attributes['rating']}")
+            found += 1
+        print(f"{found} movie(s) found")
+
+
+    @staticmethod
+    def _ask_page_size():
+        """
+        A utility command for _command_generate_website().
+        Asks the user for the number of movies per page.
+        Returns it, or None for a single page when the user
+        leaves it empty. Asks again when it is invalid.
+        """
+        while True:
+            user_input = input("Enter movies per page, "
+                               "leave empty for a single page: ").strip()
+            if not user_input:
+                return None
+            try:
+                page_size = int(user_input)
+            except ValueError:
+                page_size = 0
+            if page_size > 0:
+                return page_size
+            print("Please enter a positive number")
 
 
     def _command_generate_website(self): # menu command 9
         """
         Generates a simple HTML website displaying
-        the movies stored in the database.
-        """
-        movies_dict = self._storage.read_movies()
+        the movies stored in the database, streaming them
+        into the page one at a time. The page is left as it
+        is when nothing on it changed since the last time
+        (see website_generator).
+
+        For large databases, the website can be split into
+        pages of a number of movies, rendered in parallel,
+        with an index page and a json index of the movies.
+
+        The posters can be downloaded to _static/posters/,
+        and shown from there (see poster_mirror).
 
-        if len(movies_dict) < 1 or movies_dict is None:
+        Every page gets a gzip variant, the stylesheet a
+        fingerprinted name, and asset-manifest.json lists
+        them for a static server (see static_assets).
+        """
+        if self._storage.count() < 1:
             print("Currently there are no movies in the database.\n"
                   "Please, add movies before generating website.")
             return
 
-        movie_cards = str()
-        for title, movie_data in movies_dict.items():
-            year = movie_data.get("year")
-            poster = movie_data.get("poster")
-            movie_cards += f"""<li>
-                <div class="movie">
-                    <img class="movie-poster" src="{poster}" alt="{title}"/>
-                    <div class="movie-title"> {title} </div>
-                    <div class="movie-year"> {year} </div>
-                </div>
-            </li>"""
-
-        template_file_path = os.path.join("_static", "index_template.html")
-        with open(template_file_path, "r", encoding="utf-8") as handle:
-            html_content = handle.read()
-
-        placeholder_title = "__TEMPLATE_TITLE__"
-        placeholder_movies = "__TEMPLATE_MOVIE_GRID__"
-        html_content = html_content.replace(placeholder_title, "MS Movie App")
-        html_content = html_content.replace(placeholder_movies, movie_cards)
+        page_size = self._ask_page_size()
+        posters = None
+        if input("Use local copies of the posters? Y/N: ").lower() == "y":
+            posters, poster_report = poster_mirror.mirror_posters(
+                attributes.get("poster")
+                for _, attributes in self._storage.iter_movies())
+            print(", ".join(f"{count} {status}"
+                            for status, count in poster_report.items()),
+                  "poster(s)")
+
+        website_dir = os.path.dirname(website_generator.WEBSITE_PATH)
+        try:
+            stylesheet = static_assets.fingerprint(
+                website_dir, website_generator.STYLESHEET_NAME)
+        except OSError as e:
+            print(f"Stylesheet wasn't fingerprinted: {e}")
+            stylesheet = None
 
-        html_file_path = os.path.join("_static", "index.html")
-        with open(html_file_path, "w", encoding="utf-8") as handle:
-            handle.write(html_content)
+        try:
+            if page_size is not None:
+                report = website_generator.write_paginated_website(
+                    self._storage.iter_movies(), page_size, posters=posters,
+                    stylesheet=stylesheet, precompress=True)
+            else:
+                report = website_generator.write_website(
+                    self._storage.iter_movies(),
+                    render_cache=website_generator.RenderCache(),
+                    data_signature=(self._storage.data_signature(),
+                                    posters is not None
+                                    and poster_mirror.manifest_signature()),
+                    posters=posters, stylesheet=stylesheet, precompress=True)
+            static_assets.write_manifest(website_dir)
+        except OSError as e:
+            print(f"Website wasn't generated: {e}")
+            return
 
-        print("Website was generated successfully.")
+        if page_size is not None:
+            print(f"Website was generated successfully: "
+                  f"{report['pages']} page(s) of up to {page_size} movies.")
+        elif not report["written"]:
+            print("Website is already up to date.")
+        else:
+            print("Website was generated successfully.")
 
 
 
@@ -255,6 +364,9 @@ class MovieApp:
             7: self._command_search_movie,  #tested
             8: self._command_sort_by_rating,  #tested
             9: self._command_generate_website, #wip
+            10: self._storage.import_movies_from_file,
+            11: self._command_detailed_stats,
+            12: self._command_filter_movies,
         }
 
         try:
@@ -274,13 +386,13 @@ class MovieApp:
     def __get_valid_user_input(self):
         """
         Prints menu with available commands
-        Asks user for input, a number between 0 and 10
+        Asks user for input, a number between 0 and 12
         Else, will continue asking for a valid input
         Returns an integer
         """
         while True:
             try:
-                user_input = int(input("Enter choice (0-9): "))
+                user_input = int(input("Enter choice (0-12): "))
                 return user_input
             except ValueError:
                 print("Please enter a valid number")
@@ -302,7 +414,10 @@ class MovieApp:
                 "6. Random movie\n"
                 "7. Search movie\n"
                 "8. Movies sorted by rating\n"
-                "9. Generate website\n")
+                "9. Generate website\n"
+                "10. Import movies from file\n"
+                "11. Detailed stats\n"
+                "12. Filter movies\n")
         print(menu)
 
 
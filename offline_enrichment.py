@@ -0,0 +1,231 @@
+"""
+A module for adding movies from local IMDb dataset
+dumps (https://datasets.imdbws.com/) instead of one
+OMDb request per title:
+    title.basics.tsv(.gz)   tconst, titleType, primaryTitle,
+                            ..., startYear, ...
+    title.ratings.tsv(.gz)  tconst, averageRating, numVotes
+
+The ratings are joined to the titles on tconst, and the
+result is streamed as the same {rating, year, poster}
+records the storages use, so dumps of several gigabytes
+never have to fit in memory.
+
+It can also build a local lookup index that add_movie
+consults before requesting a movie from OMDb.
+
+It can run independently of main:
+    python offline_enrichment.py title.basics.tsv.gz
+        title.ratings.tsv.gz [--storage json|csv|csv-journal|sqlite|binary]
+        [--build-index]
+"""
+
+import os
+import csv
+import gzip
+import sqlite3
+import argparse
+from storage.search_index import normalize_title
+
+LOOKUP_INDEX_PATH = os.path.join("data", "imdb_lookup.sqlite")
+MISSING_POSTER = "N/A" # the dumps have no posters, OMDb uses "N/A"
+
+
+def _iter_tsv(file_path):
+    """
+    Reads a tab separated file, gzip compressed or not,
+    one row at a time. Yields a dictionary per row, with
+    the header as keys, where "\\N" (missing) is None.
+    """
+    if file_path.endswith(".gz"):
+        handle = gzip.open(file_path, mode="rt", encoding="utf-8", newline="")
+    else:
+        handle = open(file_path, mode="r", encoding="utf-8", newline="")
+    with handle:
+        reader = csv.reader(handle, delimiter="\t", quoting=csv.QUOTE_NONE)
+        header = next(reader, [])
+        for row in reader:
+            yield {column: (None if value == "\\N" else value)
+                   for column, value in zip(header, row)}
+
+
+def load_ratings(ratings_path, min_votes=0):
+    """
+    Builds the hash table for the join: a dictionary
+    where keys = tconst, values = tuples (rating, votes).
+    The ratings dump is the smaller of the two, only the
+    titles dump is streamed.
+    Skips titles with less than min_votes votes.
+    """
+    ratings = {}
+    for row in _iter_tsv(ratings_path):
+        try:
+            votes = int(row["numVotes"])
+            if votes >= min_votes:
+                ratings[row["tconst"]] = (float(row["averageRating"]), votes)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return ratings
+
+
+def iter_enriched_movies(basics_path, ratings_path,
+                         title_types=("movie",), min_votes=0):
+    """
+    Joins the titles dump with the ratings dump on tconst.
+
+    Streams the titles dump, keeping only title_types,
+    and yields tuples (title, attributes, votes), where
+    attributes is a dictionary with "rating", "year" and
+    "poster", like the ones returned by read_movies().
+    Titles without a rating or a year are skipped.
+    """
+    ratings = load_ratings(ratings_path, min_votes)
+    for row in _iter_tsv(basics_path):
+        if row.get("titleType") not in title_types:
+            continue
+        rating_votes = ratings.get(row.get("tconst"))
+        title = row.get("primaryTitle")
+        if rating_votes is None or not title or not row.get("startYear"):
+            continue
+        try:
+            year = int(row["startYear"])
+        except ValueError:
+            continue
+        rating, votes = rating_votes
+        yield title, {"rating": rating, "year": year,
+                      "poster": MISSING_POSTER}, votes
+
+
+def enrich_storage(storage, basics_path, ratings_path,
+                   batch_size=10000, title_types=("movie",), min_votes=0):
+    """
+    Adds every movie from the dumps to storage, any
+    IStorage subclass, with one call to upsert_movies()
+    per batch_size movies.
+    When several movies share a title, the one with the
+    most votes in the whole dumps is kept (the first one
+    for equal votes), like lookup_movie() does.
+    Returns the number of distinct titles stored.
+    """
+    best_votes = {}
+    batch = {}
+    for title, attributes, votes in iter_enriched_movies(
+            basics_path, ratings_path, title_types, min_votes):
+        if votes <= best_votes.get(title, -1):
+            continue
+        batch[title] = attributes
+        best_votes[title] = votes
+        if len(batch) >= batch_size:
+            storage.upsert_movies(batch)
+            batch = {}
+    if batch:
+        storage.upsert_movies(batch)
+    return len(best_votes)
+
+
+def build_lookup_index(basics_path, ratings_path,
+                       index_path=LOOKUP_INDEX_PATH,
+                       title_types=("movie",), min_votes=0):
+    """
+    Builds a SQLite file with every movie from the dumps,
+    indexed by normalized title, for lookup_movie().
+    Replaces the index if it already exists.
+    Returns the number of movies in the index.
+    """
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    connection = sqlite3.connect(index_path)
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE movies (title_key TEXT NOT NULL, "
+                "title TEXT NOT NULL, rating REAL NOT NULL, "
+                "year INTEGER NOT NULL, votes INTEGER NOT NULL)")
+            connection.executemany(
+                "INSERT INTO movies VALUES (?, ?, ?, ?, ?)",
+                ((normalize_title(title), title, attributes["rating"],
+                  attributes["year"], votes)
+                 for title, attributes, votes in iter_enriched_movies(
+                     basics_path, ratings_path, title_types, min_votes)))
+            connection.execute("CREATE INDEX idx_movies_title_key "
+                               "ON movies (title_key, votes)")
+        return connection.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def lookup_movie(movie_title, index_path=LOOKUP_INDEX_PATH):
+    """
+    Looks for movie_title in the local lookup index,
+    ignoring upper and lower case. When several movies
+    share the title, returns the one with the most votes.
+
+    Returns a tuple (title, attributes) like
+    data_fetcher.get_new_movie_data(), or None when the
+    movie, or the index, doesn't exist.
+    """
+    if not os.path.exists(index_path):
+        return None
+    try:
+        connection = sqlite3.connect(index_path)
+        try:
+            row = connection.execute(
+                "SELECT title, rating, year FROM movies WHERE title_key = ? "
+                "ORDER BY votes DESC LIMIT 1",
+                (normalize_title(movie_title),)).fetchone()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Error reading {index_path}: {e}")
+        return None
+    if row is None:
+        return None
+    title, rating, year = row
+    return title, {"rating": rating, "year": year, "poster": MISSING_POSTER}
+
+
+def main():
+    """
+    Parses the command line arguments, and adds the
+    movies from the dumps to the selected storage, or
+    builds the lookup index.
+    """
+    parser = argparse.ArgumentParser(
+        description="Add movies from IMDb dataset dumps.")
+    parser.add_argument("basics", help="path to title.basics.tsv(.gz)")
+    parser.add_argument("ratings", help="path to title.ratings.tsv(.gz)")
+    parser.add_argument("--storage", choices=["json", "csv", "csv-journal",
+                                               "sqlite", "binary"],
+                        help="add the movies to this storage")
+    parser.add_argument("--build-index", action="store_true",
+                        help=f"build the lookup index {LOOKUP_INDEX_PATH}")
+    parser.add_argument("--min-votes", type=int, default=0,
+                        help="skip movies with fewer votes")
+    args = parser.parse_args()
+
+    if args.build_index:
+        count = build_lookup_index(args.basics, args.ratings,
+                                   min_votes=args.min_votes)
+        print(f"{count} movie(s) in {LOOKUP_INDEX_PATH}")
+
+    if args.storage:
+        from storage.storage_binary import StorageBinary
+        from storage.storage_csv import StorageCsv
+        from storage.storage_json import StorageJson
+        from storage.storage_sqlite import StorageSqlite
+        storages = {
+            "json": lambda: StorageJson('data/movies.json'),
+            "csv": lambda: StorageCsv('data/movies.csv'),
+            "csv-journal": lambda: StorageCsv('data/movies.csv',
+                                              journaled=True),
+            "sqlite": lambda: StorageSqlite('data/movies.sqlite'),
+            "binary": lambda: StorageBinary('data/movies.bin'),
+        }
+        count = enrich_storage(storages[args.storage](),
+                               args.basics, args.ratings,
+                               min_votes=args.min_votes)
+        print(f"{count} movie(s) added to the {args.storage} storage")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+A persistent cache for responses from the OMDb API,
+stored as a json file, so movies that were looked up
+recently don't need another request.
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+from storage.search_index import normalize_title
+from file_utils import save_json
+
+
+class ResponseCache:
+    """
+    A least recently used (LRU) cache of OMDb responses.
+
+    Responses are stored under the normalized movie title
+    and, when OMDb returns one, under the IMDb ID too.
+    Each entry expires after ttl seconds. "Movie not found!"
+    responses are cached as empty dictionaries, and expire
+    after negative_ttl seconds, usually shorter.
+    When there are more than max_entries entries, the least
+    recently used ones are evicted.
+    """
+    def __init__(self, file_path, ttl=7 * 24 * 3600,
+                 negative_ttl=24 * 3600, max_entries=10000):
+        self.file_path = file_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def title_key(movie_title):
+        """
+        Returns the cache key for a movie title, normalized
+        (see normalize_title()).
+        """
+        return "title:" + normalize_title(movie_title)
+
+
+    @staticmethod
+    def imdb_key(imdb_id):
+        """
+        Returns the cache key for an IMDb ID, e.g. tt0120338
+        """
+        return "imdb:" + imdb_id.strip().lower()
+
+
+    def _load(self):
+        """
+        A utility command for every other method.
+        Loads the cache file the first time it is needed.
+        Handles missing or corrupted files by starting
+        with an empty cache.
+        """
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        try:
+            with open(self.file_path, mode="r", encoding="utf-8") as handle:
+                self._entries.update(json.load(handle))
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, TypeError, ValueError):
+            print(f"{self.file_path} is corrupted, starting a new cache")
+
+
+    def _get(self, key):
+        """
+        A utility command for get_title() and get_imdb_id().
+
+        Returns the cached response for key: a dictionary
+        with the movie information, an empty dictionary for
+        a movie that wasn't found, or None when there is no
+        valid entry. Counts hits and misses.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] < time.time():
+                del self._entries[key]
+                self._dirty = True
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["info"]
+
+
+    def get_title(self, movie_title):
+        """
+        Returns the cached response for movie_title,
+        or None when there is none.
+        """
+        return self._get(self.title_key(movie_title))
+
+
+    def get_imdb_id(self, imdb_id):
+        """
+        Returns the cached response for imdb_id,
+        or None when there is none.
+        """
+        return self._get(self.imdb_key(imdb_id))
+
+
+    def put(self, movie_title, movie_info):
+        """
+        Stores the response for movie_title. An empty
+        movie_info means the movie wasn't found, and is
+        kept for negative_ttl seconds instead of ttl.
+        Evicts the least recently used entries when the
+        cache is full.
+        """
+        ttl = self.ttl if movie_info else self.negative_ttl
+        entry = {"expires": time.time() + ttl, "info": movie_info}
+        keys = [self.title_key(movie_title)]
+        if movie_info.get("imdbID"):
+            keys.append(self.imdb_key(movie_info["imdbID"]))
+
+        with self._lock:
+            self._load()
+            for key in keys:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+
+    def flush(self):
+        """
+        Writes the cache to its file, if anything changed
+        since it was loaded or last written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                save_json(self.file_path, self._entries)
+                self._dirty = False
+            except OSError as e:
+                print(f"Cache wasn't saved: {e}")
+
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of cache
+        "hits", "misses" and "entries".
+        """
+        with self._lock:
+            self._load()
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries)}
@@ -0,0 +1,206 @@
+"""
+A module for keeping local copies of the movie posters
+in _static/posters/, so the generated website doesn't
+depend on the host of the posters.
+
+Posters are downloaded concurrently, each URL once, to a
+file named after a hash of the URL. A manifest
+(data/poster_manifest.json) remembers the ETag and
+Last-Modified headers of every poster, so a poster
+already downloaded is revalidated with a conditional
+request (If-None-Match / If-Modified-Since), and only
+downloaded again when it changed. Posters checked less
+than max_age seconds ago aren't requested at all.
+Movies without a poster ("N/A"), and posters that can't
+be downloaded, are skipped and keep their remote URL.
+"""
+
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests as req
+from requests.adapters import HTTPAdapter
+from file_utils import AtomicWriter, file_signature, save_json
+
+POSTERS_DIR = os.path.join("_static", "posters")
+MANIFEST_PATH = os.path.join("data", "poster_manifest.json")
+REQUEST_TIMEOUT = 10 # seconds
+CONCURRENCY = 8
+MAX_AGE = 24 * 3600 # seconds before a poster is checked again
+CHUNK_SIZE = 64 * 1024
+
+
+def is_missing(url):
+    """
+    Returns True when url isn't the URL of a poster, like
+    the "N/A" OMDb stores for movies without one.
+    """
+    return (not isinstance(url, str)
+            or urlsplit(url).scheme not in ("http", "https"))
+
+
+def poster_file_name(url):
+    """
+    Returns the file name of the local copy of the poster
+    at url: a hash of the URL, with the extension of the
+    URL (".jpg" when it has none).
+    """
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if not extension or len(extension) > 5:
+        extension = ".jpg"
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()[:20] + extension
+
+
+def _load_manifest(manifest_path):
+    """
+    Returns the manifest, a dictionary where keys =
+    poster URLs, values = dictionaries with the "file"
+    name of the local copy (None when the poster is
+    missing), its "etag", its "last_modified" date and
+    when it was "checked".
+    Handles missing or corrupted files as an empty
+    manifest.
+    """
+    try:
+        with open(manifest_path, mode="r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+        return manifest if isinstance(manifest, dict) else {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(manifest_path, manifest):
+    """
+    Writes the manifest to its file.
+    """
+    try:
+        save_json(manifest_path, manifest)
+    except OSError as e:
+        print(f"Poster manifest wasn't saved: {e}")
+
+
+def manifest_signature(manifest_path=MANIFEST_PATH):
+    """
+    Returns a tuple (mtime, size) describing the
+    manifest, which changes whenever a local copy
+    changes, or None when there is no manifest.
+    """
+    return file_signature(manifest_path)
+
+
+def _new_session(concurrency):
+    """
+    Returns a requests Session with a pool of up to
+    concurrency keep-alive connections.
+    """
+    session = req.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _download_poster(session, url, entry, posters_dir):
+    """
+    A utility command for mirror_posters() function.
+    Downloads the poster at url, or revalidates it when
+    entry (from the manifest) has a local copy.
+
+    Returns a tuple (status, entry), where status is
+    "downloaded", "revalidated" or "failed", and entry the
+    new manifest entry.
+    """
+    file_name = poster_file_name(url)
+    file_path = os.path.join(posters_dir, file_name)
+    headers = {}
+    if entry and entry.get("file") and os.path.exists(file_path):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    checked = time.time()
+    try:
+        with session.get(url, headers=headers, timeout=REQUEST_TIMEOUT,
+                         stream=True) as response:
+            if response.status_code == 304 and headers:
+                return "revalidated", dict(entry, checked=checked)
+            response.raise_for_status()
+            with AtomicWriter(file_path) as handle:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    handle.write(chunk)
+            return "downloaded", {
+                "file": file_name,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "checked": checked}
+    except (req.exceptions.RequestException, OSError) as e:
+        response = getattr(e, "response", None)
+        if response is None or response.status_code != 404:
+            print(f"Poster {url} wasn't downloaded: {e}")
+        if entry and entry.get("file") and os.path.exists(file_path):
+            return "failed", entry # keeps the copy it already has
+        return "failed", {"file": None, "checked": checked}
+
+
+def mirror_posters(urls, posters_dir=POSTERS_DIR,
+                   manifest_path=MANIFEST_PATH,
+                   concurrency=CONCURRENCY, max_age=MAX_AGE):
+    """
+    Makes sure there is an up to date local copy of every
+    poster in urls, an iterable of poster URLs (repeated
+    URLs and missing posters are fine).
+
+    Returns a tuple (posters, report):
+    - posters is a dictionary where keys = poster URLs,
+    values = the path of their local copy, relative to
+    the folder of the website ("posters/<file name>"),
+    for the posters that have one
+    - report is a dictionary with the number of posters
+    "downloaded", "revalidated" (still the same),
+    "fresh" (checked less than max_age seconds ago),
+    "failed" and "skipped" (movies without a poster)
+    """
+    os.makedirs(posters_dir, exist_ok=True)
+    manifest = _load_manifest(manifest_path)
+    report = {"downloaded": 0, "revalidated": 0, "fresh": 0,
+              "failed": 0, "skipped": 0}
+
+    to_check = []
+    seen = set()
+    now = time.time()
+    for url in urls:
+        if is_missing(url):
+            report["skipped"] += 1
+            continue
+        if url in seen:
+            continue
+        seen.add(url)
+        entry = manifest.get(url)
+        if (entry and now - entry.get("checked", 0) < max_age
+                and (entry.get("file") is None or os.path.exists(
+                    os.path.join(posters_dir, entry["file"])))):
+            report["fresh"] += 1
+            continue
+        to_check.append(url)
+
+    if to_check:
+        session = _new_session(concurrency)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = executor.map(
+                lambda url: _download_poster(session, url, manifest.get(url),
+                                             posters_dir),
+                to_check)
+            for url, (status, entry) in zip(to_check, results):
+                report[status] += 1
+                manifest[url] = entry
+        session.close()
+        _save_manifest(manifest_path, manifest)
+
+    posters = {url: f"posters/{entry['file']}"
+               for url, entry in manifest.items()
+               if url in seen and entry.get("file")}
+    return posters, report
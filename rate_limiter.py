@@ -0,0 +1,276 @@
+"""
+A module for pacing requests to a quota-limited API:
+a token bucket for requests per second, a daily quota
+counter that persists between runs, exponential
+backoff with jitter for retries, and a pool of API keys
+to spread requests across.
+"""
+
+import os
+import json
+import time
+import hashlib
+import random
+import datetime
+import threading
+from file_utils import save_json
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket.
+
+    Holds up to capacity tokens, refilled at rate tokens
+    per second. acquire() takes a token, waiting for one
+    when the bucket is empty, so requests are spread
+    out at no more than rate per second, with bursts of
+    up to capacity requests.
+
+    The rate adapts to the server: slow_down() halves it
+    when the server reports too many requests, and
+    speed_up() raises it again, step by step, up to
+    max_rate after successful requests.
+    """
+    def __init__(self, rate, capacity=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def _refill(self):
+        """
+        A utility command for acquire() method.
+        Adds the tokens earned since the last refill.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+    def acquire(self):
+        """
+        Takes a token from the bucket, sleeping until
+        there is one available.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+    def slow_down(self, minimum_rate=0.1):
+        """
+        Halves the rate, down to minimum_rate, and empties
+        the bucket so no burst follows a rejection.
+        """
+        with self._lock:
+            self.rate = max(minimum_rate, self.rate / 2)
+            self._tokens = 0
+            self._updated = time.monotonic()
+
+
+    def speed_up(self, step=0.1):
+        """
+        Raises the rate by a fraction step of max_rate,
+        never above max_rate.
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * step)
+
+
+class DailyQuota:
+    """
+    A thread-safe counter of requests made today, stored
+    in a json file so it persists between runs:
+        {"date": "2025-01-31", "used": 120}
+    The counter starts again from zero every day.
+    """
+    def __init__(self, file_path, limit):
+        self.file_path = file_path
+        self.limit = limit
+        self._date = None
+        self._used = 0
+        self._lock = threading.Lock()
+
+
+    def _sync(self):
+        """
+        A utility command for every other method.
+        Loads the counter the first time, and resets it
+        when the date changes.
+        Handles missing or corrupted files as a new day.
+        """
+        today = datetime.date.today().isoformat()
+        if self._date is None:
+            try:
+                with open(self.file_path, mode="r", encoding="utf-8") as handle:
+                    saved = json.load(handle)
+                self._date, self._used = saved["date"], int(saved["used"])
+            except (FileNotFoundError, json.JSONDecodeError,
+                    KeyError, TypeError, ValueError):
+                self._date, self._used = today, 0
+        if self._date != today:
+            self._date, self._used = today, 0
+
+
+    def _save(self):
+        """
+        A utility command for try_consume() method.
+        Writes the counter to its file.
+        """
+        try:
+            save_json(self.file_path, {"date": self._date, "used": self._used})
+        except OSError as e:
+            print(f"Quota counter wasn't saved: {e}")
+
+
+    def try_consume(self):
+        """
+        Counts one request if there is quota left today.
+        Returns True if the request can be made, False
+        if the daily quota is used up.
+        """
+        with self._lock:
+            self._sync()
+            if self._used >= self.limit:
+                return False
+            self._used += 1
+            self._save()
+            return True
+
+
+    def remaining(self):
+        """
+        Returns the number of requests left for today.
+        """
+        with self._lock:
+            self._sync()
+            return max(0, self.limit - self._used)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """
+    Returns how many seconds to wait before retry number
+    attempt (starting at 0): a random delay between 0 and
+    base * 2 ** attempt seconds, never more than cap
+    ("full jitter"), so clients that failed at the same
+    time don't retry at the same time.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class ApiKeyPool:
+    """
+    A thread-safe pool of API keys, each one with its own
+    TokenBucket and DailyQuota, so the throughput of the
+    pool grows with the number of keys.
+
+    acquire() hands out the available key with the most
+    quota left today, taking turns between keys with the
+    same quota left. A key that is rejected by the server
+    can be marked as exhausted with mark_exhausted(), and
+    is skipped until its cooldown is over, or as throttled
+    with mark_throttled(), and is only slowed down.
+
+    Quota counters are stored in quota_dir, in one file
+    per key named after a hash of the key, never the key.
+    """
+    def __init__(self, api_keys, quota_dir, daily_limit,
+                 requests_per_second, cooldown=3600):
+        self.cooldown = cooldown
+        self._keys = []
+        for api_key in api_keys:
+            key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+            self._keys.append({
+                "key": api_key,
+                "name": f"...{api_key[-4:]}" if len(api_key) > 4 else "...",
+                "quota": DailyQuota(os.path.join(
+                    quota_dir, f"omdb_quota_{key_hash}.json"), daily_limit),
+                "bucket": TokenBucket(requests_per_second),
+                "exhausted_until": 0.0,
+                "requests": 0,
+                "rejections": 0,
+            })
+        self._turn = 0
+        self._lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def acquire(self):
+        """
+        Picks the key to use for the next request, counts
+        the request in its daily quota and waits for its
+        token bucket.
+
+        Returns the key entry, a dictionary whose "key" is
+        the API key, or None when every key is exhausted
+        or out of quota for today.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [entry for entry in self._keys
+                          if entry["exhausted_until"] <= now
+                          and entry["quota"].remaining() > 0]
+            if not candidates:
+                return None
+            self._turn = (self._turn + 1) % len(candidates)
+            candidates = candidates[self._turn:] + candidates[:self._turn]
+            entry = max(candidates,
+                        key=lambda candidate: candidate["quota"].remaining())
+            if not entry["quota"].try_consume():
+                return None
+            entry["requests"] += 1
+        entry["bucket"].acquire()
+        return entry
+
+
+    def mark_exhausted(self, entry, cooldown=None):
+        """
+        Skips the key in entry for cooldown seconds
+        (by default, the pool's cooldown), and slows down
+        its token bucket.
+        """
+        with self._lock:
+            entry["rejections"] += 1
+            entry["exhausted_until"] = time.monotonic() + (
+                self.cooldown if cooldown is None else cooldown)
+        entry["bucket"].slow_down()
+
+
+    def mark_throttled(self, entry):
+        """
+        Counts a transient rejection of the key in entry
+        (too many requests per second) and slows down its
+        token bucket, without skipping the key.
+        """
+        with self._lock:
+            entry["rejections"] += 1
+        entry["bucket"].slow_down()
+
+
+    def usage(self):
+        """
+        Returns a list with a dictionary per key: its
+        masked "key", the "requests" made and "rejections"
+        received in this run, the "remaining" quota for
+        today and whether it is "exhausted" right now.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [{"key": entry["name"],
+                     "requests": entry["requests"],
+                     "rejections": entry["rejections"],
+                     "remaining": entry["quota"].remaining(),
+                     "exhausted": entry["exhausted_until"] > now}
+                    for entry in self._keys]
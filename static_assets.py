@@ -0,0 +1,125 @@
+"""
+A module for preparing the files of the generated
+website for a static file server:
+- fingerprinted names: a copy of an asset (style.css)
+named after a hash of its content
+(style.1a2b3c4d5e.css), so it can be cached forever,
+and a new name whenever it changes
+- precompressed variants: a gzip copy of every file
+(index.html.gz), so the server doesn't compress them on
+every request
+- a manifest, asset-manifest.json, listing every file
+with its gzip variant, sizes and the Cache-Control header
+to serve it with
+"""
+
+import os
+import re
+import gzip
+import hashlib
+from file_utils import AtomicWriter, save_json, write_atomically
+
+MANIFEST_NAME = "asset-manifest.json"
+FINGERPRINT_LENGTH = 10
+GZIP_LEVEL = 9
+CHUNK_SIZE = 256 * 1024
+CACHE_FOREVER = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+_FINGERPRINTED = re.compile(r".+\.[0-9a-f]{%d}\.[^.]+" % FINGERPRINT_LENGTH)
+
+
+def precompress(file_path):
+    """
+    Writes file_path.gz, the gzip variant of file_path,
+    a chunk at a time. The gzip header has no date, so
+    the same file always gives the same bytes.
+    Returns the size of the gzip variant.
+    """
+    with open(file_path, mode="rb") as source, \
+            AtomicWriter(file_path + ".gz") as destination, \
+            gzip.GzipFile(filename="", mode="wb", fileobj=destination,
+                          compresslevel=GZIP_LEVEL, mtime=0) as compressed:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            compressed.write(chunk)
+    return os.path.getsize(file_path + ".gz")
+
+
+def is_precompressed(file_path):
+    """
+    Returns True when file_path has a gzip variant
+    written after its last change.
+    """
+    try:
+        return (os.stat(file_path + ".gz").st_mtime_ns
+                >= os.stat(file_path).st_mtime_ns)
+    except OSError:
+        return False
+
+
+def fingerprint(website_dir, file_name):
+    """
+    Copies the asset file_name of website_dir to a name
+    with a hash of its content, with its gzip variant,
+    and removes the copies of older versions.
+    Returns the fingerprinted name.
+    """
+    with open(os.path.join(website_dir, file_name), mode="rb") as handle:
+        content = handle.read()
+    stem, extension = os.path.splitext(file_name)
+    content_hash = hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH]
+    fingerprinted_name = f"{stem}.{content_hash}{extension}"
+    fingerprinted_path = os.path.join(website_dir, fingerprinted_name)
+
+    if not os.path.exists(fingerprinted_path):
+        write_atomically(fingerprinted_path, content)
+    if not os.path.exists(fingerprinted_path + ".gz"):
+        precompress(fingerprinted_path)
+
+    older_version = re.compile(re.escape(stem) + r"\.[0-9a-f]{%d}"
+                               % FINGERPRINT_LENGTH + re.escape(extension)
+                               + r"(\.gz)?")
+    for other_name in os.listdir(website_dir):
+        if (older_version.fullmatch(other_name)
+                and not other_name.startswith(fingerprinted_name)):
+            os.remove(os.path.join(website_dir, other_name))
+    return fingerprinted_name
+
+
+def write_manifest(website_dir, skip=("index_template.html",)):
+    """
+    Writes asset-manifest.json in website_dir, with an
+    entry for every file in it (not in its subfolders),
+    except the gzip variants and skip:
+        {"index.html": {"gzip": "index.html.gz",
+                        "size": 81234, "gzip_size": 4567,
+                        "cache_control": "no-cache"},
+         "style.1a2b3c4d5e.css": {...,
+             "cache_control": "public, max-age=31536000,
+                               immutable"}}
+    Fingerprinted files can be cached forever, the others
+    must be revalidated. "gzip" is None for files without
+    a gzip variant.
+    Returns the manifest.
+    """
+    manifest = {}
+    for file_name in sorted(os.listdir(website_dir)):
+        file_path = os.path.join(website_dir, file_name)
+        if (file_name in skip or file_name == MANIFEST_NAME
+                or file_name.endswith((".gz", ".tmp"))
+                or not os.path.isfile(file_path)):
+            continue
+        gzip_path = file_path + ".gz"
+        has_gzip = os.path.exists(gzip_path)
+        manifest[file_name] = {
+            "gzip": file_name + ".gz" if has_gzip else None,
+            "size": os.path.getsize(file_path),
+            "gzip_size": os.path.getsize(gzip_path) if has_gzip else None,
+            "cache_control": (CACHE_FOREVER
+                              if _FINGERPRINTED.fullmatch(file_name)
+                              else CACHE_REVALIDATE),
+        }
+    save_json(os.path.join(website_dir, MANIFEST_NAME), manifest, indent=2)
+    return manifest
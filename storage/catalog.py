@@ -0,0 +1,359 @@
+"""
+This module contains the in-memory copy of the database
+kept by the storages: a catalog of movies that works like
+the dictionary of dictionaries returned by read_movies(),
+in a fraction of its memory.
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+FIELDS = ("rating", "year", "poster")
+# stored in the columns for a rating or year that is None
+MISSING_RATING = float("nan")
+MISSING_YEAR = -2 ** 31
+# almost every poster from OMDb is
+# POSTER_PREFIX + <id> + POSTER_SUFFIX
+POSTER_PREFIX = "https://m.media-amazon.com/images/M/"
+POSTER_SUFFIX = "._V1_SX300.jpg"
+# what the posters column holds, for each movie
+NO_POSTER, SHORT_POSTER, FULL_POSTER = 0, 1, 2
+MIN_COMPACT = 1024 # deleted rows before compacting
+
+
+class MovieRecord(Mapping):
+    """
+    The attributes of a movie in a MovieCatalog, a view
+    that reads them from the columns of the catalog, like
+    the dictionary {"rating": ..., "year": ..., "poster": ...}
+    read_movies() returns for each movie.
+
+    It is created when a movie is looked up, not stored,
+    and only holds the catalog and the title (__slots__).
+    Changing a key changes the movie in the catalog.
+    Keys other than FIELDS, if the movie has any, follow
+    the fields.
+    """
+    __slots__ = ("_catalog", "_title")
+
+    def __init__(self, catalog, title):
+        self._catalog = catalog
+        self._title = title
+
+
+    def __getitem__(self, key):
+        return self._catalog._get_field(self._title, key)
+
+
+    def __setitem__(self, key, value):
+        self._catalog._set_field(self._title, key, value)
+
+
+    def __iter__(self):
+        yield from FIELDS
+        yield from self._catalog._extras.get(self._title, ())
+
+
+    def __len__(self):
+        return len(FIELDS) + len(self._catalog._extras.get(self._title, ()))
+
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+    def __reduce__(self):
+        # pickled (e.g. sent to another process) as a
+        # dictionary, not with the whole catalog
+        return dict, (dict(self),)
+
+
+class MovieCatalog(MutableMapping):
+    """
+    The movies of the database, by title, in columns
+    instead of a dictionary per movie:
+    - the ratings in an array of doubles and the years in
+    an array of ints, 12 bytes per movie
+    - the posters in a single bytearray (UTF-8), without
+    the prefix and suffix every poster from OMDb repeats
+    (POSTER_PREFIX and POSTER_SUFFIX), with their offset,
+    length and a byte telling whether the poster was
+    shortened, kept whole or is missing in arrays
+    - the titles, interned, in a dictionary from each
+    title to its row in the columns, which also keeps the
+    order the movies were added in
+    - the keys other than rating, year and poster, for the
+    few movies that have any, in a dictionary by title
+
+    Ratings are kept as floats, so a rating of 9 reads
+    back as 9.0. A rating or a year given as a string is
+    converted, one that is None is kept as None. Other
+    values that don't fit in the columns raise a
+    ValueError, load() skips those movies and reports
+    them.
+
+    Looking up a title returns a MovieRecord, a view of
+    its row, so the catalog works like the dictionary of
+    dictionaries it replaces: catalog[title]["rating"],
+    catalog[title] = {"rating": ..., ...}, del catalog[title],
+    items() and len() behave the same, in the same order.
+
+    A deleted movie leaves an empty row, and a changed
+    poster its old bytes, the columns are compacted once
+    at least half of them are unused.
+    """
+    def __init__(self, movies=()):
+        self._rows = {}
+        self._ratings = array("d")
+        self._years = array("i")
+        self._poster_kinds = bytearray()
+        self._poster_offsets = array("Q")
+        self._poster_lengths = array("I")
+        self._poster_heap = bytearray()
+        self._extras = {}
+        self._unused_rows = 0
+        self._unused_bytes = 0
+        self.update(movies)
+
+
+    def load(self, movies):
+        """
+        Adds movies, a dictionary of dictionaries or an
+        iterable of tuples (title, attributes), skipping the
+        ones whose values can't be stored.
+        Returns a list of tuples (title, error message) with
+        the movies skipped.
+        """
+        if isinstance(movies, Mapping):
+            movies = movies.items()
+        skipped = []
+        for title, attributes in movies:
+            try:
+                self[title] = attributes
+            except (ValueError, TypeError, AttributeError) as e:
+                skipped.append((title, str(e)))
+        return skipped
+
+
+    ####### Conversions
+
+    @staticmethod
+    def _to_rating(value):
+        """
+        Returns value as stored in the ratings column.
+        Raises a ValueError if it isn't a number.
+        """
+        if value is None:
+            return MISSING_RATING
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"rating {value!r} isn't a number") from None
+
+
+    @staticmethod
+    def _to_year(value):
+        """
+        Returns value as stored in the years column.
+        Raises a ValueError if it isn't a year.
+        """
+        if value is None:
+            return MISSING_YEAR
+        try:
+            year = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"year {value!r} isn't a year") from None
+        if not MISSING_YEAR < year < 2 ** 31:
+            raise ValueError(f"year {value!r} isn't a year")
+        return year
+
+
+    @staticmethod
+    def _check_poster(value):
+        """
+        Raises a ValueError if value isn't a poster URL
+        or None.
+        """
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"poster {value!r} isn't a string")
+
+
+    ####### Posters
+
+    def _store_poster(self, poster):
+        """
+        Adds poster to the heap, without the prefix and
+        suffix when it has them.
+        Returns a tuple (kind, offset, length).
+        """
+        if poster is None:
+            return NO_POSTER, 0, 0
+        kind = FULL_POSTER
+        if (poster.startswith(POSTER_PREFIX)
+                and poster.endswith(POSTER_SUFFIX)
+                and len(poster) >= len(POSTER_PREFIX) + len(POSTER_SUFFIX)):
+            kind = SHORT_POSTER
+            poster = poster[len(POSTER_PREFIX):-len(POSTER_SUFFIX)]
+        encoded = poster.encode("utf-8")
+        offset = len(self._poster_heap)
+        self._poster_heap += encoded
+        return kind, offset, len(encoded)
+
+
+    def _set_poster(self, row, poster):
+        """
+        Stores poster as the poster of row.
+        """
+        self._unused_bytes += self._poster_lengths[row]
+        self._poster_kinds[row], self._poster_offsets[row], \
+            self._poster_lengths[row] = self._store_poster(poster)
+
+
+    def _poster(self, row):
+        """
+        Returns the poster of row as it was stored.
+        """
+        kind = self._poster_kinds[row]
+        if kind == NO_POSTER:
+            return None
+        offset = self._poster_offsets[row]
+        poster = self._poster_heap[
+            offset:offset + self._poster_lengths[row]].decode("utf-8")
+        if kind == SHORT_POSTER:
+            return POSTER_PREFIX + poster + POSTER_SUFFIX
+        return poster
+
+
+    ####### Fields
+
+    def _get_field(self, title, key):
+        """
+        A utility command for MovieRecord.
+        Returns the field key of the movie title.
+        """
+        row = self._rows[title]
+        if key == "rating":
+            rating = self._ratings[row]
+            return None if rating != rating else rating # NaN
+        if key == "year":
+            year = self._years[row]
+            return None if year == MISSING_YEAR else year
+        if key == "poster":
+            return self._poster(row)
+        return self._extras.get(title, {})[key]
+
+
+    def _set_field(self, title, key, value):
+        """
+        A utility command for MovieRecord.
+        Changes the field key of the movie title.
+        """
+        row = self._rows[title]
+        if key == "rating":
+            self._ratings[row] = self._to_rating(value)
+        elif key == "year":
+            self._years[row] = self._to_year(value)
+        elif key == "poster":
+            self._check_poster(value)
+            self._set_poster(row, value)
+            self._compact_if_needed()
+        else:
+            self._extras.setdefault(title, {})[key] = value
+
+
+    ####### Mapping
+
+    def __getitem__(self, title):
+        if title not in self._rows:
+            raise KeyError(title)
+        return MovieRecord(self, title)
+
+
+    def __setitem__(self, title, attributes):
+        rating = self._to_rating(attributes.get("rating"))
+        year = self._to_year(attributes.get("year"))
+        poster = attributes.get("poster")
+        self._check_poster(poster)
+        extras = {key: value for key, value in attributes.items()
+                  if key not in FIELDS}
+        if extras:
+            self._extras[title] = extras
+        else:
+            self._extras.pop(title, None)
+
+        row = self._rows.get(title)
+        if row is None:
+            self._ratings.append(rating)
+            self._years.append(year)
+            kind, offset, length = self._store_poster(poster)
+            self._poster_kinds.append(kind)
+            self._poster_offsets.append(offset)
+            self._poster_lengths.append(length)
+            self._rows[sys.intern(title)] = len(self._ratings) - 1
+            return
+        self._ratings[row] = rating
+        self._years[row] = year
+        if poster != self._poster(row):
+            self._set_poster(row, poster)
+            self._compact_if_needed()
+
+
+    def __delitem__(self, title):
+        row = self._rows.pop(title)
+        self._extras.pop(title, None)
+        self._unused_rows += 1
+        self._unused_bytes += self._poster_lengths[row]
+        self._compact_if_needed()
+
+
+    def __contains__(self, title):
+        return title in self._rows
+
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+    def __len__(self):
+        return len(self._rows)
+
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self)} movies)"
+
+
+    def to_dict(self):
+        """
+        Returns the movies as a new dictionary of
+        dictionaries, like the one it replaces.
+        """
+        return {title: dict(attributes) for title, attributes in self.items()}
+
+
+    def _compact_if_needed(self):
+        """
+        Removes the rows of deleted movies and the bytes of
+        old posters, once they are at least half of the
+        columns.
+        """
+        if (self._unused_rows < max(MIN_COMPACT, len(self._ratings) // 2)
+                and self._unused_bytes < max(MIN_COMPACT * 64,
+                                             len(self._poster_heap) // 2)):
+            return
+        rows = list(self._rows.values())
+        posters = [self._poster(row) for row in rows]
+        self._ratings = array("d", (self._ratings[row] for row in rows))
+        self._years = array("i", (self._years[row] for row in rows))
+        self._poster_kinds = bytearray()
+        self._poster_offsets = array("Q")
+        self._poster_lengths = array("I")
+        self._poster_heap = bytearray()
+        for poster in posters:
+            kind, offset, length = self._store_poster(poster)
+            self._poster_kinds.append(kind)
+            self._poster_offsets.append(offset)
+            self._poster_lengths.append(length)
+        self._rows = dict(zip(self._rows, range(len(rows))))
+        self._unused_rows = 0
+        self._unused_bytes = 0
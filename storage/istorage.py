@@ -3,19 +3,409 @@ This module contains an abstract class IStorage
 which performs CRUD operations on persistent storage.
 """
 from abc import ABC, abstractmethod
+import asyncio
 import json
 import csv
+import data_fetcher
+import offline_enrichment
+from file_utils import file_signature
+from storage.search_index import TrigramIndex, normalize_title
+from storage.stats_index import RatingStats
+from storage.rating_index import RatingIndex
+from storage.year_index import YearIndex
+from storage.random_index import RandomIndex
+from storage.catalog import MovieCatalog
 
 
 class IStorage(ABC):
     """
     Abstract class for StorageCsv and StorageJson
     """
+    def __init__(self):
+        self._cache = None
+        self._signature = None
+        self._cache_generation = 0
+        self._indexes = {}
+        self._indexes_token = None
+
+
+    def _file_signature(self):
+        """
+        A utility command for the in-memory cache.
+
+        Returns a tuple (mtime, size) describing the file
+        at file_path, or None when the file doesn't exist.
+        A different signature means the file was changed
+        on disk by someone else.
+        """
+        return file_signature(self.file_path)
+
+
+    def data_signature(self):
+        """
+        Returns a value that identifies the current version
+        of the database files, for caches kept outside of
+        this object: it changes whenever the files change.
+        """
+        return self._file_signature()
+
+
+    def _cache_is_fresh(self):
+        """
+        A utility command for read_movies() method.
+        Returns True when the in-memory copy of the
+        database can be used instead of parsing the file.
+        """
+        return (self._cache is not None
+                and self._signature == self._file_signature())
+
+
+    def _commit_cache(self, movies_dict):
+        """
+        A utility command for read and write methods.
+
+        Keeps movies_dict as the authoritative in-memory
+        copy of the database, matching the current state
+        of the file on disk.
+        A new dictionary, loaded from the file, starts a new
+        generation of the cache, and is kept as a
+        MovieCatalog, which takes a fraction of its memory.
+        Movies with values the catalog can't store (like a
+        rating that isn't a number) are left out, with a
+        message for each one.
+
+        Returns the in-memory copy.
+        """
+        if movies_dict is not self._cache:
+            self._cache_generation += 1
+            if not isinstance(movies_dict, MovieCatalog):
+                catalog = MovieCatalog()
+                for title, error in catalog.load(movies_dict):
+                    print(f"Skipped movie {title} in {self.file_path}: "
+                          f"{error}, it will be removed from the "
+                          f"database on the next change")
+                movies_dict = catalog
+        self._cache = movies_dict
+        self._signature = self._file_signature()
+        return movies_dict
+
+
+    def _invalidate_cache(self):
+        """
+        A utility command for write methods.
+        Drops the in-memory copy, the next call to
+        read_movies() will parse the file again.
+        """
+        self._cache = None
+        self._signature = None
+
+
     @abstractmethod
     def read_movies(self):
         """Loads a file containing data about movies"""
 
 
+    ####### Indexes
+    # Indexes are built the first time a query needs them,
+    # updated by the write methods through _update_indexes(),
+    # and rebuilt when the database changes outside of this
+    # object. An index is any object with the methods
+    # add(title, attributes), which also replaces a title
+    # already in the index, and remove(title), which does
+    # nothing for a title that isn't in it. The indexes are
+    # TrigramIndex (search_index.py), RatingStats
+    # (stats_index.py), RatingIndex (rating_index.py),
+    # YearIndex (year_index.py) and RandomIndex
+    # (random_index.py).
+
+    def _data_token(self):
+        """
+        A utility command for _get_index() method.
+
+        Returns a value that changes when the database is
+        changed by someone else, but not by the write
+        methods of this object. By default, the generation
+        of the in-memory cache, reloading it if needed.
+        """
+        self.read_movies()
+        return self._cache_generation
+
+
+    def _get_index(self, name, index_class):
+        """
+        A utility command for the query methods.
+
+        Returns the index called name, an instance of
+        index_class, building it from iter_movies() if it
+        doesn't exist yet, or if the database changed
+        outside of this object since it was built.
+        """
+        token = self._data_token()
+        if token != self._indexes_token:
+            self._indexes = {}
+            self._indexes_token = token
+
+        index = self._indexes.get(name)
+        if index is None:
+            index = index_class()
+            for title, attributes in self.iter_movies():
+                index.add(title, attributes)
+            self._indexes[name] = index
+        return index
+
+
+    def _update_indexes(self, titles):
+        """
+        A utility command for write methods.
+        Called after titles were added, updated or deleted,
+        updates every index already built.
+        """
+        if not self._indexes:
+            return
+        for title in titles:
+            attributes = self.get(title)
+            for index in self._indexes.values():
+                if attributes is None:
+                    index.remove(title)
+                else:
+                    index.add(title, attributes)
+
+
+    ####### Queries
+    # Default implementations work on the dictionary returned
+    # by read_movies(). Subclasses can override them with
+    # queries that don't need to load the whole database.
+
+    def count(self):
+        """
+        Returns the number of movies in the database.
+        Counts them one at a time when they aren't
+        already loaded in memory.
+        """
+        if self._cache_is_fresh():
+            return len(self._cache)
+        return sum(1 for _ in self.iter_movies())
+
+
+    def get(self, title):
+        """
+        Returns the attributes of the movie with that
+        exact title as a dictionary, or None if there
+        is no such movie.
+        """
+        return self.read_movies().get(title)
+
+
+    def iter_movies(self):
+        """
+        Iterates through the database, yielding tuples
+        (title, attributes) one movie at a time.
+
+        Uses the in-memory copy when it is up to date,
+        otherwise reads the file through _stream_movies()
+        without loading the whole database.
+        """
+        if self._cache_is_fresh():
+            yield from self._cache.items()
+            return
+        yield from self._stream_movies()
+
+
+    def _stream_movies(self):
+        """
+        A utility command for iter_movies() method.
+        Subclasses override it to yield tuples
+        (title, attributes) straight from the file.
+        """
+        yield from self.read_movies().items()
+
+
+    def top_k_by_rating(self, k=None):
+        """
+        Returns a list with the k best rated movies as
+        tuples (title, attributes), in descending order
+        by rating, and by title for movies sharing a rating.
+        Returns every movie when k is None.
+        """
+        return self.movies_by_rating(0, k)
+
+
+    def movies_by_rating(self, offset=0, limit=None):
+        """
+        Returns a page of the movies sorted by descending
+        rating (and by title): a list with up to limit
+        tuples (title, attributes), starting at position
+        offset. Uses the RatingIndex.
+        """
+        index = self._get_index("rating", RatingIndex)
+        return [(title, self.get(title))
+                for title, _ in index.page(offset, limit)]
+
+
+    def movies_in_rating_range(self, low, high):
+        """
+        Returns a list of tuples (title, attributes) with
+        the movies rated between low and high, both
+        included, from the highest to the lowest rating.
+        Uses the RatingIndex.
+        """
+        index = self._get_index("rating", RatingIndex)
+        return [(title, self.get(title))
+                for title, _ in index.rating_range(low, high)]
+
+
+    def filter_movies(self, years=None, ratings=None, title=None):
+        """
+        Yields tuples (title, attributes) with the movies
+        released between years = (low, high), rated
+        between ratings = (low, high), both included, and
+        whose title contains title, ignoring upper and lower
+        case. A criterion left as None matches every movie.
+
+        Each criterion has its own index (YearIndex,
+        RatingIndex, TrigramIndex). Only the candidates of
+        the criterion matching the fewest movies are read,
+        and checked against the other criteria, so the
+        order of the movies depends on that criterion.
+        """
+        plans = []
+        if years is not None:
+            year_index = self._get_index("year", YearIndex)
+            plans.append((year_index.count_in_range(*years),
+                          lambda: year_index.year_range(*years)))
+        if ratings is not None:
+            rating_index = self._get_index("rating", RatingIndex)
+            plans.append((rating_index.count_in_range(*ratings),
+                          lambda: [movie_title for movie_title, _
+                                   in rating_index.rating_range(*ratings)]))
+        if title is not None:
+            titles = self._get_index("trigram", TrigramIndex).search(title)
+            plans.append((len(titles), lambda: titles))
+        if not plans:
+            yield from self.iter_movies()
+            return
+
+        _, candidates = min(plans, key=lambda plan: plan[0])
+        for candidate in candidates():
+            attributes = self.get(candidate)
+            if attributes is not None and self._matches_filter(
+                    candidate, attributes, years, ratings, title):
+                yield candidate, attributes
+
+
+    @staticmethod
+    def _matches_filter(movie_title, attributes, years, ratings, title):
+        """
+        A utility command for filter_movies() method.
+        Returns True if the movie matches every criterion
+        that isn't None.
+        """
+        if years is not None and (attributes["year"] is None
+                                  or not years[0] <= attributes["year"]
+                                  <= years[1]):
+            return False
+        if ratings is not None and (attributes["rating"] is None
+                                    or not ratings[0] <= attributes["rating"]
+                                    <= ratings[1]):
+            return False
+        if title is not None and title.lower() not in movie_title.lower():
+            return False
+        return True
+
+
+    def rating_extremes(self):
+        """
+        Returns a tuple (best, worst), where best and worst
+        are tuples (rating, titles) with the highest and the
+        lowest rating and a list with all the titles that
+        share it. Returns None when the database is empty.
+        Uses the RatingStats index.
+        """
+        return self._get_index("stats", RatingStats).extremes()
+
+
+    def average_rating(self):
+        """
+        Returns the average rating of the movies in the
+        database, or None when it is empty.
+        Uses the RatingStats index.
+        """
+        return self._get_index("stats", RatingStats).average()
+
+
+    def median_rating(self):
+        """
+        Returns the median rating of the movies in the
+        database, or None when it is empty.
+        Uses the RatingStats index.
+        """
+        return self._get_index("stats", RatingStats).median()
+
+
+    def rating_percentile(self, percent):
+        """
+        Returns the rating below which percent % of the
+        ratings fall, or None when the database is empty.
+        Uses the RatingStats index.
+        """
+        return self._get_index("stats", RatingStats).percentile(percent)
+
+
+    def search(self, substring):
+        """
+        Returns a list of tuples (title, attributes) with
+        the movies whose title contains substring, ignoring
+        upper and lower case. Uses a TrigramIndex of the
+        titles, so only the candidate titles are checked.
+        """
+        titles = self._get_index("trigram", TrigramIndex).search(substring)
+        return [(title, self.get(title)) for title in titles]
+
+
+    def fuzzy_search(self, text, k=10, min_similarity=0.4):
+        """
+        Returns a list with up to k tuples
+        (title, attributes, score) with the movies whose
+        titles are most similar to text, even with typos,
+        from the highest to the lowest score (1 for the
+        same title). See TrigramIndex.similar().
+        """
+        index = self._get_index("trigram", TrigramIndex)
+        return [(title, self.get(title), score)
+                for title, score in index.similar(text, k, min_similarity)]
+
+
+    def find_duplicate(self, title):
+        """
+        Returns the title already in the database that is
+        the same as title, ignoring upper and lower case
+        and repeated whitespace, or None if there isn't one.
+        """
+        if self.get(title) is not None:
+            return title
+        normalized_title = normalize_title(title)
+        for candidate, _, _ in self.fuzzy_search(title, k=5,
+                                                 min_similarity=0.9):
+            if normalize_title(candidate) == normalized_title:
+                return candidate
+        return None
+
+
+    def random_movie(self, weighted=False):
+        """
+        Returns a random movie as a tuple (title, attributes),
+        or None when the database is empty. When weighted
+        is True, the chance of each movie is proportional to
+        its rating, so better rated movies come up more.
+        Uses the RandomIndex.
+        """
+        index = self._get_index("random", RandomIndex)
+        title = index.weighted_choice() if weighted else index.choice()
+        if title is None:
+            return None
+        return title, self.get(title)
+
+
     def _reset_database(self):
         """
         A utility command for read_movies() method.
@@ -26,6 +416,7 @@ class IStorage(ABC):
 
         file_path corresponds to attribute from subclass
         """
+        self._invalidate_cache()
         try:
             print(f"Reseting {self.file_path}...")
             if ".json" in self.file_path:
@@ -101,6 +492,20 @@ class IStorage(ABC):
         return movie_rating
 
 
+    def _fetch_movie_data(self, title):
+        """
+        A utility command for add_movie() method.
+        Looks for the movie in the local lookup index built
+        from IMDb dumps first, and requests it from the OMDb
+        API only when it isn't there.
+        Returns a tuple (title, attributes), or None.
+        """
+        new_movie_data = offline_enrichment.lookup_movie(title)
+        if new_movie_data is not None:
+            return new_movie_data
+        return data_fetcher.get_new_movie_data(title)
+
+
     @abstractmethod
     def add_movie(self):
         """Adds a movie to a movie database
@@ -117,3 +522,125 @@ class IStorage(ABC):
     def update_movie(self):
         """Updates a movie rating from a movie database
         Asks input for title, rating"""
+
+
+    @abstractmethod
+    def upsert_movies(self, new_movies):
+        """Adds or replaces many movies in a movie database
+        with a single write
+        Returns True when the database was updated"""
+
+
+    def import_movies(self, titles, concurrency=8):
+        """
+        Adds many movies to the movie database at once.
+
+        1. Removes repeated titles, and titles that are
+        already in the database, ignoring upper and lower
+        case and repeated whitespace (see find_duplicate())
+        2. Takes the data for the remaining titles from the
+        local lookup index when possible, and fetches the
+        others from the OMDb API with
+        data_fetcher.get_many_movie_data(), with at most
+        concurrency requests at the same time
+        3. Stores every movie found with a single call to
+        upsert_movies()
+
+        Returns a dictionary with the lists of titles
+        "added", "skipped" (already in the database or
+        repeated) and "failed" (not found in OMDb, or found
+        but not stored because the database couldn't be
+        updated).
+        """
+        report = {"added": [], "skipped": [], "failed": []}
+
+        ## Step 1
+        pending_titles = {} # normalized title: title
+        for title in titles:
+            title = title.strip()
+            if not title:
+                continue
+            normalized_title = normalize_title(title)
+            if (normalized_title in pending_titles
+                    or self.find_duplicate(title)):
+                report["skipped"].append(title)
+            else:
+                pending_titles[normalized_title] = title
+
+        ## Step 2
+        new_movies = {}
+        new_titles = set() # normalized
+
+        def add_result(title, new_movie_data):
+            if not new_movie_data:
+                report["failed"].append(title)
+                return
+            complete_title, movie_attributes = new_movie_data
+            if (normalize_title(complete_title) in new_titles
+                    or self.find_duplicate(complete_title)):
+                report["skipped"].append(title)
+                return
+            new_movies[complete_title] = movie_attributes
+            new_titles.add(normalize_title(complete_title))
+            report["added"].append(complete_title)
+
+        titles_to_fetch = []
+        for title in pending_titles.values():
+            new_movie_data = offline_enrichment.lookup_movie(title)
+            if new_movie_data is None:
+                titles_to_fetch.append(title)
+            else:
+                add_result(title, new_movie_data)
+
+        async def fetch_remaining_titles():
+            async for title, new_movie_data in data_fetcher.get_many_movie_data(
+                    titles_to_fetch, concurrency=concurrency):
+                add_result(title, new_movie_data)
+
+        if titles_to_fetch:
+            asyncio.run(fetch_remaining_titles())
+
+        ## Step 3
+        if new_movies and not self.upsert_movies(new_movies):
+            report["failed"].extend(report["added"])
+            report["added"] = []
+        return report
+
+
+    def import_movies_from_file(self): # menu command 10
+        """
+        Asks the user for the path to a text file with one
+        movie title per line, or a csv file with a "title"
+        column, and adds all those movies with
+        import_movies().
+
+        Prints the titles that were added, skipped and
+        failed, and the usage of each OMDb API key.
+        """
+        file_path = input("Enter path to file with titles: ")
+        try:
+            with open(file_path, mode='r',
+                      encoding='utf-8', newline='') as handle:
+                if file_path.lower().endswith(".csv"):
+                    rows = [row for row in csv.reader(handle) if row]
+                    column = 0
+                    if rows and "title" in rows[0]:
+                        column = rows[0].index("title")
+                        rows = rows[1:]
+                    titles = [row[column] for row in rows
+                              if len(row) > column]
+                else:
+                    titles = handle.read().splitlines()
+        except (FileNotFoundError, UnicodeDecodeError) as e:
+            print(f"Couldn't read {file_path}: {e}")
+            return
+
+        report = self.import_movies(titles)
+        for outcome in ("added", "skipped", "failed"):
+            print(f"{len(report[outcome])} movie(s) {outcome}"
+                  + (": " + ", ".join(report[outcome])
+                     if report[outcome] else ""))
+        for usage in data_fetcher.key_usage():
+            print(f"OMDb API key {usage['key']}: "
+                  f"{usage['requests']} request(s), "
+                  f"{usage['remaining']} left today")
@@ -0,0 +1,147 @@
+"""
+This module contains an index of the titles for picking
+a random movie in constant time, or one weighted by its
+rating in logarithmic time.
+"""
+
+import random
+
+
+class RandomIndex:
+    """
+    The titles in an array, with the position of each
+    title in a dictionary. A random title is a random
+    position of the array, in constant time. A deleted
+    title is replaced by the last one of the array (swap
+    remove), so the array never has holes.
+
+    For picks weighted by rating, the weights of the
+    positions (the rating in tenths, an integer, so sums
+    are exact) are kept in a Fenwick tree (binary indexed
+    tree): adding, removing or changing a weight, and
+    finding the position of a random point of the total
+    weight, take O(log n).
+    """
+    def __init__(self):
+        self._titles = []
+        self._positions = {}
+        self._weights = []
+        self._tree = [0] # 1-based, self._tree[0] is unused
+
+
+    def __len__(self):
+        return len(self._titles)
+
+
+    @staticmethod
+    def weight(attributes):
+        """
+        Returns the weight of a movie: its rating in
+        tenths, never negative, 0 without rating.
+        """
+        if attributes["rating"] is None:
+            return 0
+        return max(0, round(attributes["rating"] * 10))
+
+
+    def _prefix_sum(self, position):
+        """
+        A utility command for the Fenwick tree.
+        Returns the sum of the weights of the positions
+        before position (0-based).
+        """
+        total = 0
+        while position > 0:
+            total += self._tree[position]
+            position -= position & -position
+        return total
+
+
+    def _change_weight(self, position, delta):
+        """
+        A utility command for the Fenwick tree.
+        Adds delta to the weight of position (0-based).
+        """
+        self._weights[position] += delta
+        node = position + 1
+        while node < len(self._tree):
+            self._tree[node] += delta
+            node += node & -node
+
+
+    def add(self, title, attributes):
+        """
+        Adds a movie, or updates its weight if the title is
+        already in the index.
+        """
+        weight = self.weight(attributes)
+        position = self._positions.get(title)
+        if position is not None:
+            self._change_weight(position, weight - self._weights[position])
+            return
+
+        position = len(self._titles)
+        self._positions[title] = position
+        self._titles.append(title)
+        self._weights.append(weight)
+        node = position + 1
+        # the new node covers the positions from
+        # node - lowest bit of node to node, the others are
+        # already in the tree
+        self._tree.append(weight + self._prefix_sum(position)
+                          - self._prefix_sum(node - (node & -node)))
+
+
+    def remove(self, title):
+        """
+        Removes a movie, if it is in the index, moving the
+        last title to its position.
+        """
+        position = self._positions.pop(title, None)
+        if position is None:
+            return
+        last_position = len(self._titles) - 1
+        last_title = self._titles[last_position]
+        last_weight = self._weights[last_position]
+        self._change_weight(last_position, -last_weight)
+        if position != last_position:
+            self._change_weight(position, last_weight - self._weights[position])
+            self._titles[position] = last_title
+            self._positions[last_title] = position
+        self._titles.pop()
+        self._weights.pop()
+        self._tree.pop()
+
+
+    def choice(self):
+        """
+        Returns a random title, every title with the same
+        chance, or None if empty.
+        """
+        if not self._titles:
+            return None
+        return self._titles[random.randrange(len(self._titles))]
+
+
+    def weighted_choice(self):
+        """
+        Returns a random title, with a chance proportional
+        to its rating, or None if empty. Falls back to
+        choice() when every rating is 0.
+        """
+        total = self._prefix_sum(len(self._titles))
+        if total <= 0:
+            return self.choice()
+
+        # descends the tree to the first position whose
+        # prefix sum is greater than a random point
+        point = random.randrange(total)
+        node = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            next_node = node + step
+            if next_node < len(self._tree) and self._tree[next_node] <= point:
+                node = next_node
+                point -= self._tree[next_node]
+            step >>= 1
+        return self._titles[node]
@@ -0,0 +1,111 @@
+"""
+This module contains an index of movies ordered by
+rating, for the best movies, pages of the sorted
+listing and rating ranges without sorting the database.
+"""
+
+import bisect
+
+
+class RatingIndex:
+    """
+    The titles sorted by (rating descending, title), in
+    two parallel sorted lists: the keys (-rating, title)
+    and the negated ratings alone, for bisecting ratings.
+
+    Supports the best k movies, pages (offset, limit) of
+    the whole ordering and ranges of ratings, with a
+    binary search instead of a sort.
+    """
+    def __init__(self):
+        self._ratings = {}
+        self._keys = []
+        self._negated_ratings = []
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def add(self, title, attributes):
+        """
+        Adds a movie, or moves it to its new position if
+        the title is already in the index. A movie without
+        rating is left out.
+        """
+        rating = attributes["rating"]
+        if rating is None:
+            self.remove(title)
+            return
+        if title in self._ratings:
+            if self._ratings[title] == rating:
+                return
+            self.remove(title)
+        self._ratings[title] = rating
+        key = (-rating, title)
+        position = bisect.bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._negated_ratings.insert(position, -rating)
+
+
+    def remove(self, title):
+        """
+        Removes a movie, if it is in the index.
+        """
+        rating = self._ratings.pop(title, None)
+        if rating is None:
+            return
+        position = bisect.bisect_left(self._keys, (-rating, title))
+        del self._keys[position]
+        del self._negated_ratings[position]
+
+
+    def page(self, offset=0, limit=None):
+        """
+        Returns a list with up to limit tuples
+        (title, rating), starting at position offset of
+        the ordering. Returns every movie from offset on
+        when limit is None.
+        """
+        end = len(self._keys) if limit is None else offset + limit
+        return [(title, -negated_rating)
+                for negated_rating, title in self._keys[offset:end]]
+
+
+    def top_k(self, k):
+        """
+        Returns a list with the k best rated movies as
+        tuples (title, rating).
+        """
+        return self.page(0, k)
+
+
+    def _bounds(self, low, high):
+        """
+        A utility command for rating_range() and
+        count_in_range(). Returns the positions of the
+        first and after the last movie rated between low
+        and high.
+        """
+        return (bisect.bisect_left(self._negated_ratings, -high),
+                bisect.bisect_right(self._negated_ratings, -low))
+
+
+    def count_in_range(self, low, high):
+        """
+        Returns the number of movies rated between low and
+        high, both included.
+        """
+        start, end = self._bounds(low, high)
+        return max(0, end - start)
+
+
+    def rating_range(self, low, high):
+        """
+        Returns a list of tuples (title, rating) with the
+        movies rated between low and high, both included,
+        from the highest to the lowest rating.
+        """
+        start, end = self._bounds(low, high)
+        return [(title, -negated_rating)
+                for negated_rating, title in self._keys[start:end]]
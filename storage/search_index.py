@@ -0,0 +1,169 @@
+"""
+This module contains an inverted index of movie titles,
+for finding the titles that contain a substring, or the
+titles most similar to a text, without checking every
+title in the database.
+"""
+
+import re
+import math
+import heapq
+from collections import defaultdict
+
+
+def normalize_title(title):
+    """
+    Returns the title in lower case, without leading,
+    trailing or repeated whitespace, so "the  godfather"
+    and "The Godfather" are the same title.
+    Every module comparing titles (the storages, the
+    indexes, the OMDb cache and the local lookup index)
+    uses it, so they all agree on what the same title is.
+    """
+    return " ".join(title.split()).casefold()
+
+
+class TrigramIndex:
+    """
+    An inverted index from every trigram (3 consecutive
+    characters) of the normalized titles (see
+    normalize_title()), padded with a space at each end,
+    to the titles that contain it.
+
+    A title contains a substring only if it contains all
+    the trigrams of the substring, so search() intersects
+    their lists of titles, starting with the shortest,
+    and only checks those candidates.
+
+    similar() ranks titles by how many trigrams they share
+    with a text, which tolerates typos, and uses the lists
+    of the rarest trigrams to find the candidates.
+    """
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._keys = {}
+        self._trigram_counts = {}
+        self._order = {}
+        self._next_order = 0
+
+
+    @staticmethod
+    def trigrams(text):
+        """
+        Returns the set of trigrams of a normalized text.
+        """
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+    def __contains__(self, title):
+        return title in self._keys
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def add(self, title, attributes=None):
+        """
+        Adds a title to the index. Does nothing when the
+        title is already in it, the title is all it uses.
+        """
+        if title in self._keys:
+            return
+        key = normalize_title(title)
+        trigrams = self.trigrams(f" {key} ")
+        self._keys[title] = key
+        self._trigram_counts[title] = len(trigrams)
+        self._order[title] = self._next_order
+        self._next_order += 1
+        for trigram in trigrams:
+            self._postings[trigram].add(title)
+
+
+    def remove(self, title):
+        """
+        Removes a title from the index, if it is in it.
+        """
+        key = self._keys.pop(title, None)
+        if key is None:
+            return
+        del self._order[title]
+        del self._trigram_counts[title]
+        for trigram in self.trigrams(f" {key} "):
+            titles = self._postings[trigram]
+            titles.discard(title)
+            if not titles:
+                del self._postings[trigram]
+
+
+    def candidates(self, text):
+        """
+        Returns the set of titles that contain every
+        trigram of the normalized text, or None when the
+        text is too short to have trigrams.
+        """
+        trigrams = self.trigrams(text)
+        if not trigrams:
+            return None
+        postings = sorted((self._postings.get(trigram, set())
+                           for trigram in trigrams), key=len)
+        candidates = set(postings[0])
+        for titles in postings[1:]:
+            if not candidates:
+                break
+            candidates &= titles
+        return candidates
+
+
+    def search(self, substring):
+        """
+        Returns a list with the titles that contain
+        substring, ignoring upper and lower case and
+        repeated whitespace, in the order they were added
+        to the index.
+        """
+        search_term = re.sub(r"\s+", " ", substring.casefold())
+        candidates = self.candidates(search_term)
+        if candidates is None:
+            candidates = self._keys
+        matches = [title for title in candidates
+                   if search_term in self._keys[title]]
+        matches.sort(key=self._order.__getitem__)
+        return matches
+
+
+    def similar(self, text, k=10, min_similarity=0.4):
+        """
+        Returns a list with up to k tuples (title, score),
+        the titles most similar to text, from the highest
+        to the lowest score. The score is the Dice
+        coefficient of their trigrams, between 0 and 1
+        (identical trigrams). Titles scoring less than
+        min_similarity are left out.
+
+        A title with a score of at least min_similarity
+        shares at least min_shared trigrams with the text,
+        so it must contain one of the len(trigrams) -
+        min_shared + 1 rarest trigrams of the text: only
+        the titles in those lists are scored.
+        """
+        trigrams = self.trigrams(f" {normalize_title(text)} ")
+        if not trigrams or k <= 0:
+            return []
+
+        min_shared = max(1, math.ceil(
+            min_similarity * len(trigrams) / (2 - min_similarity)))
+        rarest = sorted(trigrams,
+                        key=lambda trigram: len(self._postings.get(trigram, ())))
+        candidates = set()
+        for trigram in rarest[:len(trigrams) - min_shared + 1]:
+            candidates.update(self._postings.get(trigram, ()))
+
+        scored = []
+        for title in candidates:
+            shared = len(trigrams & self.trigrams(f" {self._keys[title]} "))
+            score = 2 * shared / (len(trigrams) + self._trigram_counts[title])
+            if score >= min_similarity:
+                scored.append((score, -self._order[title], title))
+        return [(title, round(score, 3))
+                for score, _, title in heapq.nlargest(k, scored)]
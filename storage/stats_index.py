@@ -0,0 +1,160 @@
+"""
+This module contains an index of movie ratings grouped
+by value, for the average, median, percentiles and
+extremes without going through every movie.
+"""
+
+import bisect
+from fractions import Fraction
+
+
+class RatingStats:
+    """
+    Running statistics of the ratings in the database:
+    - the count and the exact sum of the ratings (as a
+    Fraction, so the average is the same as
+    statistics.mean()), for the average
+    - a bucket per distinct rating with its titles, and
+    the sorted list of distinct ratings, for the highest
+    and lowest ratings, the median and percentiles
+
+    Movie ratings have a single decimal, so there are at
+    most 101 distinct ratings, and walking through them
+    takes constant time whatever the size of the database.
+    """
+    def __init__(self):
+        self._ratings = {}
+        self._order = {}
+        self._next_order = 0
+        self._buckets = {}
+        self._sorted_ratings = []
+        self._sum = Fraction(0)
+
+
+    def __len__(self):
+        return len(self._ratings)
+
+
+    def add(self, title, attributes):
+        """
+        Adds a movie, or updates its rating if the title
+        is already in the index. A movie without rating
+        is left out.
+        """
+        rating = attributes["rating"]
+        if rating is None:
+            self.remove(title)
+            return
+        if title in self._ratings:
+            if self._ratings[title] == rating:
+                return
+            self._remove_rating(title)
+        else:
+            self._order[title] = self._next_order
+            self._next_order += 1
+
+        self._ratings[title] = rating
+        self._sum += Fraction(rating)
+        if rating not in self._buckets:
+            self._buckets[rating] = set()
+            bisect.insort(self._sorted_ratings, rating)
+        self._buckets[rating].add(title)
+
+
+    def remove(self, title):
+        """
+        Removes a movie, if it is in the index.
+        """
+        if title not in self._ratings:
+            return
+        self._remove_rating(title)
+        del self._ratings[title]
+        del self._order[title]
+
+
+    def _remove_rating(self, title):
+        """
+        A utility command for add() and remove() methods.
+        Takes the rating of title out of the sum and out
+        of its bucket.
+        """
+        rating = self._ratings[title]
+        self._sum -= Fraction(rating)
+        bucket = self._buckets[rating]
+        bucket.discard(title)
+        if not bucket:
+            del self._buckets[rating]
+            del self._sorted_ratings[
+                bisect.bisect_left(self._sorted_ratings, rating)]
+
+
+    def average(self):
+        """
+        Returns the average rating, or None if empty.
+        """
+        if not self._ratings:
+            return None
+        return float(self._sum / len(self._ratings))
+
+
+    def _kth_rating(self, k):
+        """
+        A utility command for median() and percentile().
+        Returns the k-th lowest rating, counting from 0.
+        """
+        for rating in self._sorted_ratings:
+            bucket_size = len(self._buckets[rating])
+            if k < bucket_size:
+                return rating
+            k -= bucket_size
+        raise IndexError(k)
+
+
+    def median(self):
+        """
+        Returns the median rating, or None if empty.
+        Same as statistics.median(): the average of the two
+        middle ratings when the count is even.
+        """
+        count = len(self._ratings)
+        if count == 0:
+            return None
+        if count % 2 == 1:
+            return self._kth_rating(count // 2)
+        return (self._kth_rating(count // 2 - 1)
+                + self._kth_rating(count // 2)) / 2
+
+
+    def percentile(self, percent):
+        """
+        Returns the rating below which percent % of the
+        ratings fall, interpolating between the two closest
+        ratings, or None if empty.
+        """
+        count = len(self._ratings)
+        if count == 0:
+            return None
+        position = (count - 1) * percent / 100
+        lower = int(position)
+        lower_rating = self._kth_rating(lower)
+        if lower == count - 1:
+            return lower_rating
+        upper_rating = self._kth_rating(lower + 1)
+        return lower_rating + (upper_rating - lower_rating) * (position - lower)
+
+
+    def extremes(self):
+        """
+        Returns a tuple (best, worst), where best and worst
+        are tuples (rating, titles) with the highest and the
+        lowest rating and the titles that share it, in the
+        order they were added. Returns None if empty.
+        """
+        if not self._sorted_ratings:
+            return None
+        extremes = []
+        for rating in (self._sorted_ratings[-1], self._sorted_ratings[0]):
+            titles = sorted(self._buckets[rating],
+                            key=self._order.__getitem__)
+            extremes.append((rating, titles))
+        return tuple(extremes)
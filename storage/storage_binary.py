@@ -0,0 +1,519 @@
+"""
+This module loads/creates a compact binary file and
+performs CRUD operations on it (persistent storage).
+"""
+
+import os
+import mmap
+import struct
+from storage.istorage import IStorage
+from storage.catalog import MovieCatalog, MISSING_RATING, MISSING_YEAR
+
+MAGIC = b"MOVB"
+VERSION = 1
+# magic, version, number of movies, offset and size of the heap
+HEADER = struct.Struct("<4sHxxIQQ")
+# rating, title offset and length, poster offset and
+# length (in the heap), year
+RECORD = struct.Struct("<dIIIIi")
+RATING = struct.Struct("<d")
+# a record number, in the table of records sorted by title
+SLOT = struct.Struct("<I")
+NO_POSTER = 0xFFFFFFFF # poster length of a movie without poster
+
+
+class StorageBinary(IStorage):
+    """
+    A subclass of IStorage dedicated to binary files.
+
+    The file has four parts:
+    - a header: "MOVB", the version of the format, the
+    number of movies, and the offset and size of the heap
+    - a fixed width record per movie, in the order they
+    were added: its rating, year, and where its title and
+    poster are in the heap
+    - a table with the record numbers sorted by title, to
+    find a title with a binary search
+    - the heap, with the titles and posters in UTF-8
+
+    The file is read through mmap: opening it only reads
+    the header, and looking up a movie reads the few pages
+    the binary search goes through, never the whole file.
+    A new rating is written in place, over the 8 bytes of
+    the old one. Adding or deleting movies writes a new
+    file, which replaces the old one when complete.
+    """
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+        self._file = None
+        self._map = None
+        self._count = 0
+        self._heap_offset = 0
+        self._known_signature = None
+        self._external_changes = 0
+
+
+    ####### File format
+
+    @staticmethod
+    def _encode(movies):
+        """
+        A utility command for _write_movies() method.
+        Returns the content of a binary file with movies,
+        an iterable of tuples (title, attributes), as bytes.
+        """
+        heap = bytearray()
+        heap_offsets = {}
+
+        def add_to_heap(text):
+            encoded = text.encode("utf-8")
+            offset = heap_offsets.get(encoded)
+            if offset is None:
+                offset = heap_offsets[encoded] = len(heap)
+                heap.extend(encoded)
+            return offset, len(encoded)
+
+        records = bytearray()
+        titles = []
+        for title, attributes in movies:
+            title_offset, title_length = add_to_heap(title)
+            poster = attributes.get("poster")
+            if poster is None:
+                poster_offset, poster_length = 0, NO_POSTER
+            else:
+                poster_offset, poster_length = add_to_heap(poster)
+            rating, year = attributes.get("rating"), attributes.get("year")
+            records.extend(RECORD.pack(
+                MISSING_RATING if rating is None else float(rating),
+                title_offset, title_length, poster_offset, poster_length,
+                MISSING_YEAR if year is None else int(year)))
+            titles.append(title.encode("utf-8"))
+
+        order = sorted(range(len(titles)), key=titles.__getitem__)
+        slots = b"".join(SLOT.pack(record) for record in order)
+        heap_offset = HEADER.size + len(records) + len(slots)
+        header = HEADER.pack(MAGIC, VERSION, len(titles),
+                             heap_offset, len(heap))
+        return b"".join((header, records, slots, heap))
+
+
+    def _write_movies(self, movies):
+        """
+        A utility command for write methods.
+        Writes movies, an iterable of tuples
+        (title, attributes), to a new file, which replaces
+        the old one when complete.
+        """
+        content = self._encode(movies)
+        self._close()
+        temporary_path = self.file_path + ".tmp"
+        try:
+            with open(temporary_path, mode="wb") as handle:
+                handle.write(content)
+            os.replace(temporary_path, self.file_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        self._known_signature = self._file_signature()
+
+
+    def _close(self):
+        """
+        Closes the memory map and the file, if open.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+    def _open(self):
+        """
+        A utility command for every other method.
+
+        Maps the database file into memory, the first time
+        or when it was replaced, creating it with example
+        data when it doesn't exist. Only reads the header.
+        Handles errors for corrupted database files.
+
+        Returns the mmap, or None when the file can't be
+        read.
+        """
+        movie_dict_example = {
+            "Titanic": {"rating": 9.0, "year": 1999,
+                        "poster": "https://m.media-amazon.com/"
+                            "images/M/MV5BYzYyN2FiZmUtYWYzMy00M"
+                            "zViLWJkZTMtOGY1ZjgzNWMwN2YxXkEyXkF"
+                            "qcGc@._V1_SX300.jpg"},
+            "Up": {"rating": 8.3, "year": 2009,
+                   "poster": "https://m.media-amazon.com/images/"
+                             "M/MV5BNmI1ZTc5MWMtMDYyOS00ZDc2LTkz"
+                             "OTAtNjQ4NWIxNjYyNDgzXkEyXkFqcGc@._"
+                             "V1_SX300.jpg"},
+            "The Godfather": {"rating": 9.0, "year": 1972,
+                              "poster": "https://m.media-amazon."
+                                "com/images/M/MV5BNGEwYjgwOGQtYj"
+                                "g5ZS00Njc1LTk2ZGEtM2QwZWQ2NjdhZ"
+                                "TE5XkEyXkFqcGc@._V1_SX300.jpg"}
+        }
+
+        signature = self._file_signature()
+        if self._map is not None and signature == self._known_signature:
+            return self._map
+
+        self._close()
+        if signature is None:
+            self._write_movies(movie_dict_example.items())
+            signature = self._known_signature
+
+        try:
+            self._file = open(self.file_path, mode="r+b")
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            magic, version, count, heap_offset, heap_size = \
+                HEADER.unpack_from(self._map, 0)
+            if (magic != MAGIC or version != VERSION
+                    or heap_offset != HEADER.size
+                    + count * (RECORD.size + SLOT.size)
+                    or heap_offset + heap_size != len(self._map)):
+                raise ValueError("not a valid movie database")
+        except (OSError, ValueError, struct.error) as e:
+            self._close()
+            print(f"{self.file_path} is corrupted: {e}")
+            reset = input("Do you want to reset the binary database? Y/N: ")
+            if reset == "Y":
+                self._reset_database()
+                return self._open()
+            print("No action taken")
+            return None
+
+        if signature != self._known_signature:
+            self._external_changes += 1
+            self._known_signature = signature
+        self._count = count
+        self._heap_offset = heap_offset
+        return self._map
+
+
+    def _reset_database(self):
+        """
+        A utility command for _open() method.
+        Replaces the database with an empty one.
+        Called as a result of corrupt files.
+        """
+        print(f"Reseting {self.file_path}...")
+        self._invalidate_cache()
+        try:
+            self._write_movies([])
+        except OSError as e:
+            print(e)
+
+
+    def _data_token(self):
+        """
+        A utility command for the indexes kept by IStorage.
+        Changes only when the file was replaced or changed
+        by someone else, not by the write methods of this
+        object.
+        """
+        self._open()
+        return self._external_changes
+
+
+    ####### Records
+
+    def _record_offset(self, record):
+        """
+        Returns the offset of record (its number) in the file.
+        """
+        return HEADER.size + record * RECORD.size
+
+
+    def _text(self, offset, length):
+        """
+        Returns the string at offset in the heap.
+        """
+        start = self._heap_offset + offset
+        return self._map[start:start + length].decode("utf-8")
+
+
+    def _movie(self, record):
+        """
+        Returns the movie in record (its number) as a tuple
+        (title, attributes).
+        """
+        rating, title_offset, title_length, poster_offset, \
+            poster_length, year = RECORD.unpack_from(
+                self._map, self._record_offset(record))
+        poster = (None if poster_length == NO_POSTER
+                  else self._text(poster_offset, poster_length))
+        return (self._text(title_offset, title_length),
+                {"rating": None if rating != rating else rating, # NaN
+                 "year": None if year == MISSING_YEAR else year,
+                 "poster": poster})
+
+
+    def _find(self, title):
+        """
+        Returns the record number of the movie with that
+        exact title, or None, with a binary search of the
+        table of titles.
+        """
+        if self._open() is None:
+            return None
+        key = title.encode("utf-8")
+        slots_offset = HEADER.size + self._count * RECORD.size
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            record = SLOT.unpack_from(
+                self._map, slots_offset + middle * SLOT.size)[0]
+            _, title_offset, title_length, _, _, _ = RECORD.unpack_from(
+                self._map, self._record_offset(record))
+            start = self._heap_offset + title_offset
+            candidate = self._map[start:start + title_length]
+            if candidate == key:
+                return record
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+
+    def _set_rating(self, record, rating):
+        """
+        Writes a new rating in place, over the old one.
+        """
+        self._file.seek(self._record_offset(record))
+        self._file.write(RATING.pack(
+            MISSING_RATING if rating is None else float(rating)))
+        self._file.flush()
+        self._known_signature = self._file_signature()
+
+
+    def read_movies(self):
+        """
+        Loads/creates a binary file containing data about
+        movies.
+
+        If the database doesn't exist, creates and populates
+        it with example data.
+        Handles errors for corrupted database files.
+
+        The dictionary is kept in memory and returned again
+        by later calls, the file is only read again when it
+        changes on disk.
+
+        Returns a MovieCatalog, which works like a dictionary
+        where keys = movie titles, values = dictionaries
+        with movie attributes like rating and release year.
+
+        For example, the function may return:
+        {
+          "Titanic": {
+            "rating": 9,
+            "year": 1999
+            "poster": "https://m.media-amazon.com/
+                       images/...X300.jpg"
+            }
+        }
+        """
+        if self._open() is None:
+            return {}
+        if self._cache_is_fresh():
+            return self._cache
+        return self._commit_cache(MovieCatalog(self.iter_movies()))
+
+
+    def _save_movies(self, movies_dict, changed_titles):
+        """
+        Utility command for write, delete, update methods.
+        Writes movies_dict to a new file, keeps it as the
+        in-memory copy of the database, and updates the
+        indexes for the changed_titles.
+        Returns True when the file was written.
+        """
+        try:
+            self._write_movies(movies_dict.items())
+            self._commit_cache(movies_dict)
+            self._update_indexes(changed_titles)
+        except OSError as e:
+            self._invalidate_cache()
+            print(f"Database wasn't updated: {e}")
+            return False
+        return True
+
+
+    ####### Queries, served by the memory map
+
+    def count(self):
+        """
+        Returns the number of movies, from the header.
+        """
+        return self._count if self._open() is not None else 0
+
+
+    def get(self, title):
+        """
+        Returns the attributes of the movie with that
+        exact title, or None if there is no such movie.
+        """
+        record = self._find(title)
+        if record is None:
+            return None
+        return self._movie(record)[1]
+
+
+    def iter_movies(self):
+        """
+        Iterates through the database, yielding tuples
+        (title, attributes) one record at a time, in the
+        order they were added.
+        """
+        if self._open() is None:
+            return
+        for record in range(self._count):
+            yield self._movie(record)
+
+
+    ####### Write methods
+
+    def upsert_movies(self, new_movies):
+        """
+        Adds or replaces every movie in new_movies, a
+        dictionary of dictionaries like the one returned by
+        read_movies().
+        When only ratings change, they are written in
+        place, otherwise a new file is written once.
+        Returns True when the changes were written.
+        """
+        if self._open() is None:
+            return False
+        records = {}
+        for title, movie in new_movies.items():
+            record = self._find(title)
+            if record is None:
+                break
+            attributes = self._movie(record)[1]
+            if (attributes["year"] != movie.get("year")
+                    or attributes["poster"] != movie.get("poster")):
+                break
+            records[title] = record
+        else:
+            # the in-memory copy is only patched if it matched
+            # the file before this write, otherwise it is
+            # dropped and read again from the file
+            cache_was_fresh = self._cache_is_fresh()
+            try:
+                for title, record in records.items():
+                    self._set_rating(record, new_movies[title]["rating"])
+            except OSError as e:
+                self._invalidate_cache()
+                print(f"Database wasn't updated: {e}")
+                return False
+            if cache_was_fresh:
+                for title, movie in new_movies.items():
+                    self._cache[title]["rating"] = movie["rating"]
+                self._commit_cache(self._cache)
+            else:
+                self._invalidate_cache()
+            self._update_indexes(list(new_movies))
+            return True
+
+        movies = self.read_movies()
+        movies.update(new_movies)
+        return self._save_movies(movies, list(new_movies))
+
+
+    def add_movie(self): # menu command 2
+        """
+        Adds a movie to the movie database.
+
+        Prompts the user for a movie title, fetches movie
+        data (OMBd API), and adds it to the database if
+        the title is unique, ignoring upper and lower case.
+        If the title already exists or data fetching fails,
+        an appropriate error message is displayed.
+
+        If the movie is successfully added, a confirmation
+        message is printed.
+        """
+        title = self.check_title()
+        existing_title = self.find_duplicate(title)
+        if existing_title is not None:
+            print(f"{existing_title} already exists in database")
+            return
+
+        new_movie_data = self._fetch_movie_data(title)
+        if new_movie_data is None:
+            print(f"Error fetching data for {title}")
+            return
+
+        complete_title, movie_attributes = new_movie_data
+        movies = self.read_movies()
+        movies[complete_title] = movie_attributes
+        self._save_movies(movies, [complete_title])
+
+        if self.get(complete_title) is not None:
+            print(f"{title} successfully added")
+
+
+    def delete_movie(self): # menu command 3
+        """
+        Deletes a movie from the movie database.
+
+        Checks if there is data to delete, if so
+        Checks movie exists in the database, if so
+        writes the database again without it.
+
+        Prints a message to inform the user of the operation
+        result.
+        """
+        if self.count() == 0:
+            print("Currently there are no movies in the database")
+            return
+
+        title = self.check_title()
+        if self._find(title) is None:
+            print(f"Movie {title} doesn't exist!")
+            return
+
+        movies = self.read_movies()
+        del movies[title]
+        self._save_movies(movies, [title])
+        if self.get(title) is None:
+            print(f"Movie {title} successfully deleted")
+
+
+    def update_movie(self): # menu command 4
+        """
+        Updates a movie rating from the movie database.
+
+        Checks if there is data to update, if so
+        Checks movie exists in the database, if so
+        writes the new rating in place, without rewriting
+        the rest of the file.
+
+        Prints a message to inform the user with the operation
+        result.
+        """
+        if self.count() == 0:
+            print("Currently there are no movies in the database")
+            return
+
+        title = self.check_title()
+        attributes = self.get(title)
+        if attributes is None:
+            print(f"Movie {title} doesn't exist!")
+            return
+
+        new_rating = self.check_rating()
+        self.upsert_movies({title: dict(attributes, rating=new_rating)})
+
+        if self.get(title)["rating"] == new_rating:
+            print(f"Movie {title} successfully updated")
+        else:
+            print("Something went wrong...")
@@ -1,21 +1,72 @@
 """
-This module loads/creates a Json file and performs
+This module loads/creates a CSV file and performs
 CRUD operations on it (persistent storage).
 """
 
 import os
 import csv
 from storage.istorage import IStorage
-import data_fetcher
 
 
 class StorageCsv(IStorage):
     """
     A subclass of IStorage dedicated to CSV files.
+
+    In journaled mode, each add, delete or update is
+    appended as a single row to a journal file next to
+    the csv file (file_path + ".journal") instead of
+    rewriting every row. The journal is replayed over the
+    csv file when loading it, and merged back into the
+    csv file (compacted) once it grows past
+    compact_threshold bytes.
     """
-    def __init__(self, file_path):
+    def __init__(self, file_path, journaled=False,
+                 compact_threshold=64 * 1024):
         super().__init__()
         self.file_path = file_path
+        self.journal_path = file_path + ".journal"
+        self.journaled = journaled
+        self.compact_threshold = compact_threshold
+
+
+    def _file_signature(self):
+        """
+        A utility command for the in-memory cache.
+        The journal is part of the database, so its
+        (mtime, size) are part of the signature too.
+        """
+        try:
+            stat = os.stat(self.journal_path)
+            journal_signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            journal_signature = None
+        return super()._file_signature(), journal_signature
+
+
+    def _reset_database(self):
+        """
+        Resets the csv file and discards the journal.
+        """
+        super()._reset_database()
+        self._remove_journal()
+
+
+    @staticmethod
+    def _parse_attributes(rating, year, poster):
+        """
+        A utility command for the methods reading the csv
+        file and the journal.
+        Returns the attributes of a movie from the strings
+        in its row. A rating, year or poster written as an
+        empty string (None when it was written) is None.
+        Raises a ValueError when rating or year isn't a
+        number.
+        """
+        return {
+            "rating": float(rating) if rating else None,
+            "year": int(year) if year else None,
+            "poster": poster or None
+        }
 
 
     def _parse_csv_to_dict(self):
@@ -36,14 +87,114 @@ class StorageCsv(IStorage):
             reader = csv.DictReader(handle)
             for row in reader:
                 title = row["title"]
-                movies_dictionary[title] = {
-                    "rating": float(row["rating"]),
-                    "year": int(row["year"]),
-                    "poster": str(row["poster"])
-                }
+                movies_dictionary[title] = self._parse_attributes(
+                    row["rating"], row["year"], row["poster"])
+        self._replay_journal(movies_dictionary)
         return movies_dictionary
 
 
+    def _replay_journal(self, movies_dict, keep_deleted=False):
+        """
+        A utility command for _parse_csv_to_dict() and
+        _stream_movies() methods.
+
+        Applies the changes stored in the journal, in the
+        order they were made, to the dictionary parsed from
+        the csv file. Each journal row is either:
+            set,title,rating,year,poster
+            del,title
+        With keep_deleted, deleted titles are kept in the
+        dictionary with None as their value, and a title
+        added again after it was deleted moves to the end,
+        like it does in a dictionary replayed without
+        keep_deleted.
+
+        Rows that can't be parsed (for example, a row cut
+        in half by a crash while it was being written)
+        are skipped.
+
+        Returns the set of titles deleted in the journal,
+        even if they were added again after.
+        """
+        deleted_titles = set()
+        if not os.path.exists(self.journal_path):
+            return deleted_titles
+        with open(self.journal_path, mode='r',
+                  encoding='utf-8', newline='') as handle:
+            for row in csv.reader(handle):
+                try:
+                    if row[0] == "set" and len(row) == 5:
+                        attributes = self._parse_attributes(*row[2:])
+                        if keep_deleted and row[1] in deleted_titles:
+                            # added again: moves to the end
+                            movies_dict.pop(row[1], None)
+                        movies_dict[row[1]] = attributes
+                    elif row[0] == "del" and len(row) == 2:
+                        deleted_titles.add(row[1])
+                        if keep_deleted:
+                            movies_dict[row[1]] = None
+                        else:
+                            movies_dict.pop(row[1], None)
+                except (ValueError, IndexError):
+                    print(f"Skipping corrupted row in {self.journal_path}")
+        return deleted_titles
+
+
+    def _stream_movies(self):
+        """
+        A utility command for iter_movies() method.
+
+        Yields tuples (title, attributes) while reading the
+        csv file row by row with a DictReader, so the whole
+        database is never in memory at once.
+        Only the journal, which compact() keeps small, is
+        loaded beforehand: movies changed in it are yielded
+        with their new attributes, deleted movies are
+        skipped, and movies added in it, or deleted and
+        added again, are yielded after the rows of the csv
+        file. The order is the same as read_movies().
+        """
+        if not os.path.exists(self.file_path):
+            yield from self.read_movies().items()
+            return
+
+        changes = {}
+        deleted_titles = self._replay_journal(changes, keep_deleted=True)
+        changed_titles = set()
+
+        try:
+            with open(self.file_path, mode='r',
+                      encoding='utf-8', newline='') as handle:
+                for row in csv.DictReader(handle):
+                    title = row["title"]
+                    if title in deleted_titles:
+                        continue # yielded after the rows, if added again
+                    if title in changes:
+                        changed_titles.add(title)
+                        yield title, changes[title]
+                        continue
+                    yield title, self._parse_attributes(
+                        row["rating"], row["year"], row["poster"])
+        except ValueError: #NoneType
+            print(f"Error parsing data in {self.file_path}")
+            return
+
+        for title, attributes in changes.items():
+            if attributes is not None and title not in changed_titles:
+                yield title, attributes
+
+
+    def _remove_journal(self):
+        """
+        A utility command for compacting and resetting
+        the database. Deletes the journal file if any.
+        """
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+
     def read_movies(self):
         """
         Loads/creates a csv file containing data about movies.
@@ -52,8 +203,13 @@ class StorageCsv(IStorage):
         an example *dictionary of dictionaries*, there
         is an empty csv file or empty with a header.
 
-        Returns a *dictionary of nested dictionaries* that
-        contains the movies information in the database.
+        Returns a MovieCatalog, which works like a
+        *dictionary of nested dictionaries*, that contains
+        the movies information in the database.
+
+        The parsed dictionary is kept in memory and returned
+        again by later calls, the file is only parsed again
+        when its modification time or size changes on disk.
 
         For example, the function may return:
         {
@@ -80,6 +236,9 @@ class StorageCsv(IStorage):
                        "2QwZWQ2NjdhZTE5XkEyXkFqcGc@._V1_SX300.jpg"}
                             ]
 
+        if self._cache_is_fresh():
+            return self._cache
+
         try:
             if not os.path.exists(self.file_path):
                 with open(file=self.file_path, mode='w',
@@ -91,7 +250,8 @@ class StorageCsv(IStorage):
                         writer.writerow([movie["title"], movie["rating"],
                                          movie["year"], movie["poster"]])
 
-            return self._parse_csv_to_dict()
+            movies_dict = self._parse_csv_to_dict()
+            return self._commit_cache(movies_dict)
         except FileNotFoundError:
             print(f"File not found: {self.file_path}")
             return {}
@@ -99,13 +259,16 @@ class StorageCsv(IStorage):
             print(f"Error parsing data in {self.file_path}")
             self._reset_database()
             print("Database has been reset")
-            return self._parse_csv_to_dict()
+            movies_dict = self._parse_csv_to_dict()
+            return self._commit_cache(movies_dict)
 
 
     def _update_csv(self, movies_dict):
         """
         Utility command for write, delete, update methods.
-        Writes the provided movie dictionary to the csv file.
+        Writes the provided movie dictionary to the csv file,
+        and keeps it as the in-memory copy of the database.
+        Returns True when the file was written.
         """
         try:
             with open(self.file_path, mode='w',
@@ -116,8 +279,80 @@ class StorageCsv(IStorage):
                     writer.writerow([movie_title, movie_data.get("rating"),
                                      movie_data.get("year"),
                                      movie_data.get("poster")])
+            self._remove_journal()
+            self._commit_cache(movies_dict)
+        except Exception as e:
+            self._invalidate_cache()
+            print(f"Database wasn't updated: {e}")
+            return False
+        return True
+
+
+    def _save_changes(self, movies_dict, titles):
+        """
+        Utility command for write, delete, update methods.
+
+        Stores the changes made to titles in movies_dict.
+        Without journal, rewrites the whole csv file.
+        In journaled mode, appends a single row per title to
+        the journal: "set" when the movie is in movies_dict,
+        "del" when it has been removed from it.
+        Compacts the journal once it is bigger than
+        compact_threshold.
+        Updates the indexes for the changed titles.
+        Returns True when the changes were stored.
+        """
+        if not self.journaled:
+            if not self._update_csv(movies_dict):
+                return False
+            self._update_indexes(titles)
+            return True
+
+        rows = []
+        for title in titles:
+            if title in movies_dict:
+                movie_data = movies_dict[title]
+                rows.append(["set", title, movie_data.get("rating"),
+                             movie_data.get("year"),
+                             movie_data.get("poster")])
+            else:
+                rows.append(["del", title])
+
+        try:
+            with open(self.journal_path, mode='a',
+                      encoding='utf-8', newline='') as handle:
+                csv.writer(handle).writerows(rows)
+            self._commit_cache(movies_dict)
+            self._update_indexes(titles)
         except Exception as e:
+            self._invalidate_cache()
             print(f"Database wasn't updated: {e}")
+            return False
+
+        if os.path.getsize(self.journal_path) > self.compact_threshold:
+            self.compact()
+        return True
+
+
+    def compact(self):
+        """
+        Merges the journal into the csv file: rewrites the
+        csv file with the current movies and deletes the
+        journal.
+        """
+        self._update_csv(self.read_movies())
+
+
+    def upsert_movies(self, new_movies):
+        """
+        Adds or replaces every movie in new_movies, a
+        dictionary of dictionaries like the one returned by
+        read_movies(), with a single write to the database.
+        Returns True when the changes were stored.
+        """
+        movies = self.read_movies()
+        movies.update(new_movies)
+        return self._save_changes(movies, list(new_movies))
 
 
     def add_movie(self): # menu command 2
@@ -129,29 +364,29 @@ class StorageCsv(IStorage):
         example movies.
         Prompts the user for a movie title, fetches movie
         data (OMBd API), and adds it to the database if
-        the title is unique.
+        the title is unique, ignoring upper and lower case.
         If the title already exists or data fetching fails,
         an appropriate error message is displayed.
 
         If the movie is successfully added, a confirmation
         message is printed.
         """
-        self.read_movies()
         movies = self.read_movies()
 
         title = self.check_title()
-        if title in movies:
-            print(f"{title} already exists in database")
+        existing_title = self.find_duplicate(title)
+        if existing_title is not None:
+            print(f"{existing_title} already exists in database")
             return
 
-        new_movie_data = data_fetcher.get_new_movie_data(title)
+        new_movie_data = self._fetch_movie_data(title)
         if new_movie_data is None:
             print(f"Error fetching data, {title} not found in OMDb")
             return
 
         complete_title, movie_attributes = new_movie_data
         movies[complete_title] = movie_attributes
-        self._update_csv(movies)
+        self._save_changes(movies, [complete_title])
 
         if complete_title in self.read_movies().keys():
             print(f"{title} successfully added")
@@ -184,7 +419,7 @@ class StorageCsv(IStorage):
             return
 
         del movies[title]
-        self._update_csv(movies)
+        self._save_changes(movies, [title])
 
         if title not in self.read_movies():
             print(f"Movie {title} successfully deleted")
@@ -218,7 +453,7 @@ class StorageCsv(IStorage):
 
         new_rating = self.check_rating()
         movies[title]["rating"] = new_rating
-        self._update_csv(movies)
+        self._save_changes(movies, [title])
 
         if self.read_movies()[title]["rating"] == new_rating:
             print(f"Movie {title} successfully updated")
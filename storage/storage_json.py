@@ -6,7 +6,6 @@ CRUD operations on it (persistent storage).
 import json
 import os
 from storage.istorage import IStorage
-import data_fetcher
 
 
 class StorageJson(IStorage):
@@ -28,9 +27,13 @@ class StorageJson(IStorage):
         Handles errors by returning an empty dictionary.
         Handles errors for missing or corrupted JSON file.
 
-        Returns a dictionary where keys = movie titles,
-        values = dictionaries with movie attributes like
-        rating and release year.
+        The parsed dictionary is kept in memory and returned
+        again by later calls, the file is only parsed again
+        when its modification time or size changes on disk.
+
+        Returns a MovieCatalog, which works like a dictionary
+        where keys = movie titles, values = dictionaries
+        with movie attributes like rating and release year.
 
         For example, the function may return:
         {
@@ -60,6 +63,9 @@ class StorageJson(IStorage):
                                 "TE5XkEyXkFqcGc@._V1_SX300.jpg"}
         }
 
+        if self._cache_is_fresh():
+            return self._cache
+
         try:
             if not os.path.exists(self.file_path):
                 with open(file=self.file_path, mode='w',
@@ -68,7 +74,8 @@ class StorageJson(IStorage):
 
             with open(file=self.file_path, mode="r",
                       encoding="utf-8") as handle:
-                return json.load(handle)
+                movies_dict = json.load(handle)
+            return self._commit_cache(movies_dict)
 
         except FileNotFoundError:
             print(f"{self.file_path} not found.")
@@ -82,17 +89,166 @@ class StorageJson(IStorage):
         return {}
 
 
-    def _update_json(self, updated_movie_dict):
+    def _stream_movies(self):
+        """
+        A utility command for iter_movies() method.
+
+        Yields tuples (title, attributes) while reading the
+        json file in chunks with _iter_json_object(), so the
+        whole database is never in memory at once.
+        Handles errors for a corrupted JSON file by stopping
+        the iteration.
+        """
+        if not os.path.exists(self.file_path):
+            yield from self.read_movies().items()
+            return
+
+        try:
+            with open(file=self.file_path, mode="r",
+                      encoding="utf-8") as handle:
+                yield from self._iter_json_object(handle)
+        except json.JSONDecodeError:
+            print(f"{self.file_path} is corrupted")
+
+
+    @staticmethod
+    def _iter_json_object(handle, chunk_size=64 * 1024):
+        """
+        A utility command for _stream_movies() method.
+
+        An incremental tokenizer for a file containing a
+        single JSON object: reads chunk_size characters at a
+        time, decodes one key and one value at a time with
+        json.JSONDecoder.raw_decode(), and drops what has
+        already been decoded from the buffer.
+
+        Yields tuples (key, value).
+        Raises json.JSONDecodeError when the file isn't a
+        valid JSON object.
+        """
+        decoder = json.JSONDecoder()
+        buffer = ""
+        position = 0
+        at_eof = False
+
+        def fill():
+            nonlocal buffer, position, at_eof
+            chunk = handle.read(chunk_size)
+            at_eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+        def skip_whitespace():
+            nonlocal position
+            while True:
+                while (position < len(buffer)
+                       and buffer[position] in " \t\n\r"):
+                    position += 1
+                if position < len(buffer) or at_eof:
+                    return
+                fill()
+
+        def next_char():
+            nonlocal position
+            skip_whitespace()
+            if position >= len(buffer):
+                raise json.JSONDecodeError("Unexpected end of file",
+                                           buffer, position)
+            position += 1
+            return buffer[position - 1]
+
+        def decode_value():
+            nonlocal position
+            skip_whitespace()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                    # a number at the end of the buffer may be cut,
+                    # even after a "." or an "e" ("1." of "1.5")
+                    if at_eof or (end < len(buffer)
+                                  and buffer[end] not in "0123456789.eE+-"):
+                        position = end
+                        return value
+                except json.JSONDecodeError:
+                    if at_eof:
+                        raise
+                fill()
+
+        if next_char() != "{":
+            raise json.JSONDecodeError("Expecting '{'", buffer, position)
+        skip_whitespace()
+        if buffer[position:position + 1] == "}":
+            return
+
+        while True:
+            key = decode_value()
+            if not isinstance(key, str) or next_char() != ":":
+                raise json.JSONDecodeError("Expecting 'key: value'",
+                                           buffer, position)
+            yield key, decode_value()
+
+            separator = next_char()
+            if separator == "}":
+                return
+            if separator != ",":
+                raise json.JSONDecodeError("Expecting ',' or '}'",
+                                           buffer, position)
+
+
+    @staticmethod
+    def _dump_movies(movies, handle):
+        """
+        A utility command for _update_json() method.
+
+        Writes movies, a dictionary or a MovieCatalog, to
+        handle one movie at a time, in the same format as
+        json.dump(movies, handle, indent=4), since json can
+        only dump real dictionaries.
+        The values are written as the catalog keeps them:
+        every rating as a float (9 is written as 9.0) and
+        years given as strings as numbers.
+        """
+        handle.write("{")
+        separator = "\n    "
+        for title, attributes in movies.items():
+            handle.write(separator + json.dumps(title) + ": "
+                         + json.dumps(dict(attributes), indent=4)
+                         .replace("\n", "\n    "))
+            separator = ",\n    "
+        handle.write("}" if separator == "\n    " else "\n}")
+
+
+    def _update_json(self, updated_movie_dict, changed_titles=()):
         """
         Utility command for write, delete, update methods.
-        Writes the provided movie dictionary to the json file.
+        Writes the provided movie dictionary to the json file,
+        keeps it as the in-memory copy of the database, and
+        updates the indexes for the changed_titles.
+        Returns True when the file was written.
         """
         try:
             with open(file=self.file_path, mode='w',
                   encoding="utf-8") as handle:
-                json.dump(updated_movie_dict, handle, indent=4)
+                self._dump_movies(updated_movie_dict, handle)
+            self._commit_cache(updated_movie_dict)
+            self._update_indexes(changed_titles)
         except Exception as e:
+            self._invalidate_cache()
             print(f"Database wasn't updated: {e}")
+            return False
+        return True
+
+
+    def upsert_movies(self, new_movies):
+        """
+        Adds or replaces every movie in new_movies, a
+        dictionary of dictionaries like the one returned by
+        read_movies(), with a single write to the json file.
+        Returns True when the file was written.
+        """
+        movies = self.read_movies()
+        movies.update(new_movies)
+        return self._update_json(movies, list(new_movies))
 
 
     def add_movie(self): # menu command 2
@@ -104,29 +260,29 @@ class StorageJson(IStorage):
         example movies.
         Prompts the user for a movie title, fetches movie
         data (OMBd API), and adds it to the database if
-        the title is unique.
+        the title is unique, ignoring upper and lower case.
         If the title already exists or data fetching fails,
         an appropriate error message is displayed.
 
         If the movie is successfully added, a confirmation
         message is printed.
         """
-        self.read_movies()
         movies = self.read_movies()
 
         title = self.check_title()
-        if title in movies:
-            print(f"{title} already exists in database")
+        existing_title = self.find_duplicate(title)
+        if existing_title is not None:
+            print(f"{existing_title} already exists in database")
             return
 
-        new_movie_data = data_fetcher.get_new_movie_data(title)
+        new_movie_data = self._fetch_movie_data(title)
         if new_movie_data is None:
             print(f"Error fetching data for {title}")
             return
 
         complete_title, movie_attributes = new_movie_data
         movies[complete_title] = movie_attributes
-        self._update_json(movies)
+        self._update_json(movies, [complete_title])
 
         if title in self.read_movies().keys():
             print(f"{title} successfully added")
@@ -159,7 +315,7 @@ class StorageJson(IStorage):
             return
 
         del movies[title]
-        self._update_json(movies)
+        self._update_json(movies, [title])
         if title not in self.read_movies():
             print(f"Movie {title} successfully deleted")
 
@@ -189,7 +345,7 @@ class StorageJson(IStorage):
 
         new_rating = self.check_rating()
         movies[title]["rating"] = new_rating
-        self._update_json(movies)
+        self._update_json(movies, [title])
 
         if self.read_movies()[title]["rating"] == new_rating:
             print(f"Movie {title} successfully updated")
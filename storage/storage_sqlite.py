@@ -0,0 +1,483 @@
+"""
+This module loads/creates a SQLite database file and
+performs CRUD operations on it (persistent storage).
+"""
+
+import sqlite3
+from storage.istorage import IStorage
+from storage.search_index import normalize_title
+from storage.catalog import MovieCatalog
+
+
+class StorageSqlite(IStorage):
+    """
+    A subclass of IStorage dedicated to SQLite files.
+
+    Movies are stored as rows of a single table, with
+    indexes on the normalized title, the rating and the
+    year, so looking up, updating or deleting a single
+    movie doesn't need to read or rewrite the others.
+    """
+    def __init__(self, file_path):
+        super().__init__()
+        self.file_path = file_path
+        self._connection = None
+
+
+    def _connect(self):
+        """
+        A utility command for every other method.
+
+        Opens the database file (the first time only),
+        creates the movies table and its indexes, and
+        populates it with example data when it is new.
+        Returns a sqlite3 connection.
+        """
+        if self._connection is not None:
+            return self._connection
+
+        movie_dict_example = {
+            "Titanic": {"rating": 9.0, "year": 1999,
+                        "poster": "https://m.media-amazon.com/"
+                            "images/M/MV5BYzYyN2FiZmUtYWYzMy00M"
+                            "zViLWJkZTMtOGY1ZjgzNWMwN2YxXkEyXkF"
+                            "qcGc@._V1_SX300.jpg"},
+            "Up": {"rating": 8.3, "year": 2009,
+                   "poster": "https://m.media-amazon.com/images/"
+                             "M/MV5BNmI1ZTc5MWMtMDYyOS00ZDc2LTkz"
+                             "OTAtNjQ4NWIxNjYyNDgzXkEyXkFqcGc@._"
+                             "V1_SX300.jpg"},
+            "The Godfather": {"rating": 9.0, "year": 1972,
+                              "poster": "https://m.media-amazon."
+                                "com/images/M/MV5BNGEwYjgwOGQtYj"
+                                "g5ZS00Njc1LTk2ZGEtM2QwZWQ2NjdhZ"
+                                "TE5XkEyXkFqcGc@._V1_SX300.jpg"}
+        }
+
+        connection = sqlite3.connect(self.file_path)
+        with connection:
+            table_exists = connection.execute(
+                "SELECT 1 FROM sqlite_master "
+                "WHERE type = 'table' AND name = 'movies'").fetchone()
+            if table_exists:
+                self._allow_missing_values(connection)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS movies ("
+                "title TEXT PRIMARY KEY, "
+                "title_key TEXT NOT NULL, "
+                "rating REAL, "
+                "year INTEGER, "
+                "poster TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS "
+                               "idx_movies_title_key ON movies (title_key)")
+            connection.execute("CREATE INDEX IF NOT EXISTS "
+                               "idx_movies_rating ON movies (rating)")
+            connection.execute("CREATE INDEX IF NOT EXISTS "
+                               "idx_movies_rating_title "
+                               "ON movies (rating DESC, title)")
+            connection.execute("CREATE INDEX IF NOT EXISTS "
+                               "idx_movies_year ON movies (year)")
+            if not table_exists:
+                connection.executemany(
+                    "INSERT INTO movies VALUES (?, ?, ?, ?, ?)",
+                    [(title, normalize_title(title),
+                      movie["rating"], movie["year"], movie["poster"])
+                     for title, movie in movie_dict_example.items()])
+        self._connection = connection
+        return connection
+
+
+    @staticmethod
+    def _allow_missing_values(connection):
+        """
+        A utility command for _connect() method.
+
+        Databases created before a rating or a year could be
+        missing (None) don't accept NULL in those columns.
+        SQLite can't change that in place, so their movies
+        are moved, in the same order, to a new table, which
+        _connect() then creates with its indexes.
+        """
+        required = {name for _, name, _, not_null, _, _
+                    in connection.execute("PRAGMA table_info(movies)")
+                    if not_null}
+        if not required & {"rating", "year"}:
+            return
+        connection.execute("ALTER TABLE movies RENAME TO movies_old")
+        connection.execute(
+            "CREATE TABLE movies ("
+            "title TEXT PRIMARY KEY, "
+            "title_key TEXT NOT NULL, "
+            "rating REAL, "
+            "year INTEGER, "
+            "poster TEXT)")
+        connection.execute(
+            "INSERT INTO movies SELECT title, title_key, rating, year, "
+            "poster FROM movies_old ORDER BY rowid")
+        connection.execute("DROP TABLE movies_old")
+
+
+    def _has_title(self, title):
+        """
+        A utility command for write, delete, update methods.
+        Returns True when there is a movie with exactly
+        that title, using the primary key index.
+        """
+        row = self._connect().execute(
+            "SELECT 1 FROM movies WHERE title = ?", (title,)).fetchone()
+        return row is not None
+
+
+    def _count_movies(self):
+        """
+        A utility command for delete and update methods.
+        Returns the number of movies in the database.
+        """
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM movies").fetchone()[0]
+
+
+    def _reset_database(self):
+        """
+        A utility command for read_movies() method.
+        Deletes every movie from the database.
+        Called as a result of corrupt files.
+        """
+        print(f"Reseting {self.file_path}...")
+        try:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            with open(self.file_path, mode='wb'):
+                pass
+            self._connect().execute("DELETE FROM movies")
+            self._connection.commit()
+        except (OSError, sqlite3.Error) as e:
+            print(e)
+
+
+    def read_movies(self):
+        """
+        Loads/creates a SQLite file containing data about movies.
+
+        If the database doesn't exist, creates and populates
+        it with example data.
+        Handles errors for corrupted database files.
+
+        Returns a MovieCatalog, which works like a dictionary
+        where keys = movie titles, values = dictionaries
+        with movie attributes like rating and release year.
+
+        For example, the function may return:
+        {
+          "Titanic": {
+            "rating": 9,
+            "year": 1999
+            "poster": "https://m.media-amazon.com/
+                       images/...X300.jpg"
+            }
+        }
+        """
+        try:
+            rows = self._connect().execute(
+                "SELECT title, rating, year, poster FROM movies "
+                "ORDER BY rowid")
+            return MovieCatalog((title, {"rating": rating, "year": year,
+                                         "poster": poster})
+                                for title, rating, year, poster in rows)
+        except sqlite3.DatabaseError as e:
+            print(f"{self.file_path} is corrupted: {e}")
+            reset = input("Do you want to reset the SQLite database? Y/N: ")
+            if reset == "Y":
+                self._reset_database()
+            else:
+                print("No action taken")
+        return {}
+
+
+    def _data_token(self):
+        """
+        A utility command for the indexes kept by IStorage.
+        SQLite's data_version changes only when another
+        connection changes the database.
+        """
+        connection = self._connect()
+        return (id(connection),
+                connection.execute("PRAGMA data_version").fetchone()[0])
+
+
+    ####### Queries, computed by SQLite
+    # The average, median and percentiles come from the
+    # RatingStats index of IStorage, kept up to date by the
+    # write methods, instead of a query that reads every row.
+
+    @staticmethod
+    def _row_to_movie(row):
+        """
+        A utility command for the query methods.
+        Converts a row (title, rating, year, poster) into
+        a tuple (title, attributes).
+        """
+        title, rating, year, poster = row
+        return title, {"rating": rating, "year": year, "poster": poster}
+
+
+    def count(self):
+        """
+        Returns the number of movies in the database.
+        """
+        return self._count_movies()
+
+
+    def get(self, title):
+        """
+        Returns the attributes of the movie with that
+        exact title, or None if there is no such movie.
+        """
+        row = self._connect().execute(
+            "SELECT title, rating, year, poster FROM movies "
+            "WHERE title = ?", (title,)).fetchone()
+        return None if row is None else self._row_to_movie(row)[1]
+
+
+    def find_duplicate(self, title):
+        """
+        Returns the title already in the database that is
+        the same as title, ignoring upper and lower case
+        and repeated whitespace, or None if there isn't one.
+        Looks it up in the title_key index, the exact title
+        first, without building the search index.
+        """
+        row = self._connect().execute(
+            "SELECT title FROM movies WHERE title_key = ? "
+            "ORDER BY title = ? DESC LIMIT 1",
+            (normalize_title(title), title)).fetchone()
+        return None if row is None else row[0]
+
+
+    def iter_movies(self):
+        """
+        Iterates through the database, yielding tuples
+        (title, attributes) one row at a time.
+        """
+        rows = self._connect().execute(
+            "SELECT title, rating, year, poster FROM movies "
+            "ORDER BY rowid")
+        for row in rows:
+            yield self._row_to_movie(row)
+
+
+    def movies_by_rating(self, offset=0, limit=None):
+        """
+        Returns a page of the movies sorted by descending
+        rating (and by title), using the rating index:
+        a list with up to limit tuples (title, attributes),
+        starting at position offset. Movies without a rating
+        are left out, like RatingIndex does.
+        """
+        rows = self._connect().execute(
+            "SELECT title, rating, year, poster FROM movies "
+            "WHERE rating IS NOT NULL "
+            "ORDER BY rating DESC, title LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset))
+        return [self._row_to_movie(row) for row in rows]
+
+
+    def movies_in_rating_range(self, low, high):
+        """
+        Returns a list of tuples (title, attributes) with
+        the movies rated between low and high, both
+        included, using the rating index.
+        """
+        rows = self._connect().execute(
+            "SELECT title, rating, year, poster FROM movies "
+            "WHERE rating BETWEEN ? AND ? ORDER BY rating DESC, title",
+            (low, high))
+        return [self._row_to_movie(row) for row in rows]
+
+
+    def filter_movies(self, years=None, ratings=None, title=None):
+        """
+        Yields tuples (title, attributes) with the movies
+        matching every criterion that isn't None, one row
+        at a time, like IStorage.filter_movies().
+
+        The year and rating ranges are pushed down to a
+        WHERE clause, so SQLite serves them with the year or
+        rating index. The title, which no index can serve,
+        is checked on the rows it returns.
+        """
+        clauses, parameters = [], []
+        if years is not None:
+            clauses.append("year BETWEEN ? AND ?")
+            parameters.extend(years)
+        if ratings is not None:
+            clauses.append("rating BETWEEN ? AND ?")
+            parameters.extend(ratings)
+        query = "SELECT title, rating, year, poster FROM movies"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        else:
+            query += " ORDER BY rowid"
+        rows = self._connect().execute(query, parameters)
+        search_term = None if title is None else title.lower()
+        for row in rows:
+            if search_term is None or search_term in row[0].lower():
+                yield self._row_to_movie(row)
+
+
+    def rating_extremes(self):
+        """
+        Returns a tuple (best, worst), where best and worst
+        are tuples (rating, titles), or None when the
+        database is empty. Uses the rating index.
+        """
+        connection = self._connect()
+        best_rating, worst_rating = connection.execute(
+            "SELECT MAX(rating), MIN(rating) FROM movies").fetchone()
+        if best_rating is None:
+            return None
+
+        extremes = []
+        for rating in (best_rating, worst_rating):
+            rows = connection.execute(
+                "SELECT title FROM movies WHERE rating = ? ORDER BY rowid",
+                (rating,))
+            extremes.append((rating, [title for (title,) in rows]))
+        return tuple(extremes)
+
+
+    def upsert_movies(self, new_movies):
+        """
+        Adds or replaces every movie in new_movies, a
+        dictionary of dictionaries like the one returned by
+        read_movies(), in a single transaction.
+        Returns True when the transaction was committed.
+        """
+        try:
+            connection = self._connect()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO movies VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (title) DO UPDATE SET "
+                    "rating = excluded.rating, year = excluded.year, "
+                    "poster = excluded.poster",
+                    [(title, normalize_title(title),
+                      movie.get("rating"), movie.get("year"),
+                      movie.get("poster"))
+                     for title, movie in new_movies.items()])
+        except sqlite3.Error as e:
+            print(f"Database wasn't updated: {e}")
+            return False
+        self._update_indexes(list(new_movies))
+        return True
+
+
+    def add_movie(self): # menu command 2
+        """
+        Adds a movie to the movie database.
+
+        Prompts the user for a movie title, fetches movie
+        data (OMBd API), and inserts it in the database if
+        the title is unique, ignoring upper and lower case.
+        If the title already exists or data fetching fails,
+        an appropriate error message is displayed.
+
+        If the movie is successfully added, a confirmation
+        message is printed.
+        """
+        title = self.check_title()
+        existing_title = self.find_duplicate(title)
+        if existing_title is not None:
+            print(f"{existing_title} already exists in database")
+            return
+
+        new_movie_data = self._fetch_movie_data(title)
+        if new_movie_data is None:
+            print(f"Error fetching data for {title}")
+            return
+
+        complete_title, movie_attributes = new_movie_data
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO movies VALUES (?, ?, ?, ?, ?)",
+                    (complete_title, normalize_title(complete_title),
+                     movie_attributes.get("rating"),
+                     movie_attributes.get("year"),
+                     movie_attributes.get("poster")))
+        except sqlite3.Error as e:
+            print(f"Database wasn't updated: {e}")
+            return
+
+        self._update_indexes([complete_title])
+        print(f"{title} successfully added")
+
+
+    def delete_movie(self): # menu command 3
+        """
+        Deletes a movie from the movie database.
+
+        Checks if there is data to delete, if so
+        Checks movie exists in the database, if so
+        deletes its row.
+
+        Prints a message to inform the user of the operation
+        result.
+        """
+        if self._count_movies() == 0:
+            print("Currently there are no movies in the database")
+            return
+
+        title = self.check_title()
+        if not self._has_title(title):
+            print(f"Movie {title} doesn't exist!")
+            return
+
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM movies WHERE title = ?",
+                                   (title,))
+        except sqlite3.Error as e:
+            print(f"Database wasn't updated: {e}")
+            return
+
+        self._update_indexes([title])
+        print(f"Movie {title} successfully deleted")
+
+
+    def update_movie(self): # menu command 4
+        """
+        Updates a movie rating from the movie database.
+
+        Checks if there is data to update, if so
+        Checks movie exists in the database, if so
+        updates the rating of that single row.
+
+        Prints a message to inform the user with the operation
+        result.
+        """
+        if self._count_movies() == 0:
+            print("Currently there are no movies in the database")
+            return
+
+        title = self.check_title()
+        if not self._has_title(title):
+            print(f"Movie {title} doesn't exist!")
+            return
+
+        new_rating = self.check_rating()
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "UPDATE movies SET rating = ? WHERE title = ?",
+                    (new_rating, title))
+        except sqlite3.Error as e:
+            print(f"Database wasn't updated: {e}")
+            return
+
+        self._update_indexes([title])
+        print(f"Movie {title} successfully updated")
@@ -0,0 +1,85 @@
+"""
+This module contains an index of movies ordered by
+release year, for counting and listing the movies of a
+range of years.
+"""
+
+import bisect
+
+
+class YearIndex:
+    """
+    The titles sorted by (year, title), in two parallel
+    sorted lists: the keys (year, title) and the years
+    alone, for bisecting years.
+    """
+    def __init__(self):
+        self._years = {}
+        self._keys = []
+        self._sorted_years = []
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def add(self, title, attributes):
+        """
+        Adds a movie, or moves it to its new position if
+        the title is already in the index. A movie without
+        year is left out.
+        """
+        year = attributes["year"]
+        if year is None:
+            self.remove(title)
+            return
+        if title in self._years:
+            if self._years[title] == year:
+                return
+            self.remove(title)
+        self._years[title] = year
+        key = (year, title)
+        position = bisect.bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._sorted_years.insert(position, year)
+
+
+    def remove(self, title):
+        """
+        Removes a movie, if it is in the index.
+        """
+        year = self._years.pop(title, None)
+        if year is None:
+            return
+        position = bisect.bisect_left(self._keys, (year, title))
+        del self._keys[position]
+        del self._sorted_years[position]
+
+
+    def _bounds(self, low, high):
+        """
+        A utility command for year_range() and
+        count_in_range(). Returns the positions of the
+        first and after the last movie between low and high.
+        """
+        return (bisect.bisect_left(self._sorted_years, low),
+                bisect.bisect_right(self._sorted_years, high))
+
+
+    def count_in_range(self, low, high):
+        """
+        Returns the number of movies released between low
+        and high, both included.
+        """
+        start, end = self._bounds(low, high)
+        return max(0, end - start)
+
+
+    def year_range(self, low, high):
+        """
+        Returns a list with the titles of the movies
+        released between low and high, both included,
+        from the oldest to the newest.
+        """
+        start, end = self._bounds(low, high)
+        return [title for _, title in self._keys[start:end]]
@@ -0,0 +1,77 @@
+"""
+Tests for file_utils: a file is replaced only by a
+complete new version, and no temporary file is left.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from file_utils import AtomicWriter, file_signature, save_json, \
+    write_atomically
+
+
+class TestAtomicWriter(unittest.TestCase):
+    """
+    Writes files in a temporary folder.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.file_path = os.path.join(self.directory, "file.txt")
+        write_atomically(self.file_path, b"old")
+
+
+    def read(self):
+        """
+        Returns the content of the file.
+        """
+        with open(self.file_path, mode="rb") as handle:
+            return handle.read()
+
+
+    def test_replaces_the_file(self):
+        with AtomicWriter(self.file_path) as handle:
+            handle.write(b"new")
+            self.assertEqual(self.read(), b"old")
+        self.assertEqual(self.read(), b"new")
+        self.assertEqual(os.listdir(self.directory), ["file.txt"])
+
+
+    def test_error_keeps_the_old_file(self):
+        with self.assertRaises(ValueError):
+            with AtomicWriter(self.file_path) as handle:
+                handle.write(b"half")
+                raise ValueError
+        self.assertEqual(self.read(), b"old")
+        self.assertEqual(os.listdir(self.directory), ["file.txt"])
+
+
+    def test_discard_keeps_the_old_file(self):
+        signature = file_signature(self.file_path)
+        writer = AtomicWriter(self.file_path)
+        with writer as handle:
+            handle.write(b"same")
+            writer.discard()
+        self.assertEqual(self.read(), b"old")
+        self.assertEqual(file_signature(self.file_path), signature)
+        self.assertEqual(os.listdir(self.directory), ["file.txt"])
+
+
+    def test_save_json_creates_the_folder(self):
+        file_path = os.path.join(self.directory, "data", "cache.json")
+        save_json(file_path, {"a": [1, 2]}, indent=2)
+        with open(file_path, encoding="utf-8") as handle:
+            self.assertEqual(json.load(handle), {"a": [1, 2]})
+
+
+    def test_file_signature(self):
+        self.assertIsNone(file_signature(self.file_path + ".missing"))
+        signature = file_signature(self.file_path)
+        write_atomically(self.file_path, b"longer")
+        self.assertNotEqual(file_signature(self.file_path), signature)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Tests for IStorage.import_movies(): titles repeated in the
+input, or already in the database, are skipped ignoring
+upper and lower case and repeated whitespace.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import storage.istorage
+from storage.storage_json import StorageJson
+from storage.storage_sqlite import StorageSqlite
+
+
+def lookup_movie(title):
+    """
+    Stands in for offline_enrichment.lookup_movie(),
+    finds every title, "Movie Four" as "MOVIE 4".
+    """
+    if title == "Movie Four":
+        title = "MOVIE 4"
+    return title.title(), {"rating": 5.0, "year": 2000, "poster": "N/A"}
+
+
+class TestImportMovies(unittest.TestCase):
+    """
+    Imports titles into a new StorageJson, looking them
+    up with lookup_movie().
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.storage = StorageJson(os.path.join(self.directory, "movies.json"))
+        self.storage.read_movies()
+
+
+    def import_movies(self, titles):
+        """
+        Returns the report of import_movies(titles) and
+        the titles that were looked up.
+        """
+        lookup = mock.Mock(side_effect=lookup_movie)
+        with mock.patch.object(storage.istorage.offline_enrichment,
+                               "lookup_movie", lookup):
+            report = self.storage.import_movies(titles)
+        return report, [call.args[0] for call in lookup.call_args_list]
+
+
+    def test_repeated_titles_are_looked_up_once(self):
+        report, looked_up = self.import_movies(
+            ["Movie 4", "MOVIE 4", " movie   4 ", "Other"])
+        self.assertEqual(looked_up, ["Movie 4", "Other"])
+        self.assertEqual(report["added"], ["Movie 4", "Other"])
+        self.assertEqual(report["skipped"], ["MOVIE 4", "movie   4"])
+
+
+    def test_titles_in_the_database_are_skipped(self):
+        report, looked_up = self.import_movies(["TITANIC", "up"])
+        self.assertEqual(looked_up, [])
+        self.assertEqual(report["skipped"], ["TITANIC", "up"])
+
+
+    def test_looked_up_titles_already_added_are_skipped(self):
+        report, looked_up = self.import_movies(["movie 4", "Movie Four"])
+        self.assertEqual(looked_up, ["movie 4", "Movie Four"])
+        self.assertEqual(report["added"], ["Movie 4"])
+        self.assertEqual(report["skipped"], ["Movie Four"])
+
+
+    def test_titles_not_stored_are_reported_as_failed(self):
+        self.storage = StorageSqlite(os.path.join(self.directory,
+                                                  "movies.sqlite3"))
+        with self.storage._connect() as connection:
+            connection.execute(
+                "CREATE TRIGGER no_inserts BEFORE INSERT ON movies "
+                "BEGIN SELECT RAISE(ABORT, 'read only'); END")
+        with mock.patch("builtins.print"):
+            report, _ = self.import_movies(["Movie 4", "Other", "up"])
+        self.assertEqual(report, {"added": [], "skipped": ["up"],
+                                  "failed": ["Movie 4", "Other"]})
+        self.assertIsNone(self.storage.get("Movie 4"))
+
+
+if __name__ == "__main__":
+    unittest.main()
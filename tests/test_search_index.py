@@ -0,0 +1,44 @@
+"""
+Tests for TrigramIndex: titles are indexed normalized,
+the same way find_duplicate() compares them.
+"""
+
+import unittest
+from storage.search_index import TrigramIndex, normalize_title
+
+
+class TestNormalizedKeys(unittest.TestCase):
+    """
+    Titles with odd upper and lower case or whitespace.
+    """
+    def setUp(self):
+        self.index = TrigramIndex()
+        for title in ("The   Godfather", "Up", "\tAmélie  "):
+            self.index.add(title)
+
+
+    def test_similar_ignores_case_and_whitespace(self):
+        self.assertEqual(self.index.similar("the godfather", k=1),
+                         [("The   Godfather", 1.0)])
+        self.assertEqual(self.index.similar("AMÉLIE", k=1),
+                         [("\tAmélie  ", 1.0)])
+
+
+    def test_search_ignores_repeated_whitespace(self):
+        self.assertEqual(self.index.search("e  god"), ["The   Godfather"])
+        self.assertEqual(self.index.search("GODFATHER"), ["The   Godfather"])
+
+
+    def test_remove(self):
+        self.index.remove("The   Godfather")
+        self.assertEqual(self.index.search("god"), [])
+        self.assertEqual(len(self.index), 2)
+
+
+    def test_normalize_title(self):
+        self.assertEqual(normalize_title("  The \t GODFATHER "),
+                         "the godfather")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Tests for the rating statistics: the Movie stats command
+must print the same output as it did before RatingStats,
+when it computed everything from read_movies().
+"""
+
+import contextlib
+import io
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import unittest
+from unittest import mock
+from movie_app import MovieApp
+from storage.storage_binary import StorageBinary
+from storage.storage_csv import StorageCsv
+from storage.storage_json import StorageJson
+from storage.storage_sqlite import StorageSqlite
+
+STORAGES = (("json", StorageJson), ("csv", StorageCsv),
+            ("sqlite", StorageSqlite), ("bin", StorageBinary))
+
+
+def reference_stats(movies):
+    """
+    The Movie stats command as it was before RatingStats:
+    returns what it printed for movies, a dictionary of
+    dictionaries like the one returned by read_movies().
+    """
+    if len(movies) < 1:
+        return "Currently there are no movies in the database.\n"
+    lines = []
+    ratings = [movie["rating"] for movie in movies.values()]
+    lines.append(f"\nAverage rating: {round(statistics.mean(ratings), 2)}")
+    lines.append(f"Median rating: {round(statistics.median(ratings), 2)}")
+
+    rated_movies = [(attributes["rating"], title)
+                    for title, attributes in movies.items()]
+    sorted_rated_movies = sorted(rated_movies, key=lambda rating: rating[0])
+    best_rating = sorted_rated_movies[-1][0]
+    best_movies = [movie for movie in rated_movies if movie[0] == best_rating]
+    worst_rating = sorted_rated_movies[0][0]
+    worst_movies = [movie for movie in rated_movies if movie[0] == worst_rating]
+    for extremes, extreme_movies in [("Best", best_movies),
+                                     ("Worst", worst_movies)]:
+        if len(extreme_movies) == 1:
+            lines.append(f"{extremes} movie: {extreme_movies[0][1]}, "
+                         f"{extreme_movies[0][0]}")
+        else:
+            lines.append(f"{extremes} movies: " + ", ".join(
+                f"{title}, {rating}" for rating, title in extreme_movies))
+    return "\n".join(lines) + "\n"
+
+
+class TestMovieStats(unittest.TestCase):
+    """
+    Compares the output of the Movie stats command with
+    reference_stats() on every storage, after each change
+    of a series of random adds, updates and deletes, so
+    the incremental updates of RatingStats are checked too.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+    @staticmethod
+    def command_output(storage):
+        """
+        Returns what the Movie stats command prints.
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            MovieApp(storage)._command_movie_stats()
+        return output.getvalue()
+
+
+    @staticmethod
+    def delete(storage, title):
+        """
+        Deletes title through the menu command.
+        """
+        with mock.patch("builtins.input", return_value=title), \
+                mock.patch("builtins.print"):
+            storage.delete_movie()
+
+
+    def test_same_output_as_before(self):
+        for name, storage_class in STORAGES:
+            with self.subTest(storage=name):
+                storage = storage_class(
+                    os.path.join(self.directory, f"movies.{name}"))
+                generator = random.Random(name)
+                titles = [f"Movie {number}" for number in range(30)]
+                for _ in range(150):
+                    title = generator.choice(titles)
+                    if generator.random() < 0.2:
+                        if storage.get(title) is not None:
+                            self.delete(storage, title)
+                    else:
+                        storage.upsert_movies({title: {
+                            # few distinct ratings, so ties are common
+                            "rating": generator.choice(
+                                [1.0, 2.5, 5.0, 7.3, 7.3, 8.8, 9.0]),
+                            "year": 2000, "poster": "N/A"}})
+                    movies = {title: dict(attributes) for title, attributes
+                              in storage.read_movies().items()}
+                    self.assertEqual(self.command_output(storage),
+                                     reference_stats(movies))
+
+
+    def test_empty_database(self):
+        storage = StorageJson(os.path.join(self.directory, "empty.json"))
+        for title in list(storage.read_movies()):
+            self.delete(storage, title)
+        self.assertEqual(self.command_output(storage), reference_stats({}))
+
+
+    def test_statistics_match_the_statistics_module(self):
+        generator = random.Random(7)
+        storage = StorageSqlite(os.path.join(self.directory, "many.sqlite"))
+        storage.upsert_movies({f"Movie {number}": {
+            "rating": generator.randint(0, 100) / 10, "year": 2000,
+            "poster": "N/A"} for number in range(1001)})
+        ratings = [attributes["rating"]
+                   for _, attributes in storage.iter_movies()]
+        self.assertAlmostEqual(storage.average_rating(),
+                               statistics.mean(ratings))
+        self.assertEqual(storage.median_rating(), statistics.median(ratings))
+        self.assertEqual(storage.rating_extremes()[0][0], max(ratings))
+        self.assertEqual(storage.rating_extremes()[1][0], min(ratings))
+
+
+if __name__ == "__main__":
+    unittest.main()
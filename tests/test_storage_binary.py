@@ -0,0 +1,57 @@
+"""
+Tests for StorageBinary: ratings written in place keep the
+in-memory copy right, also when another instance changed
+the file.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from storage.storage_binary import StorageBinary
+
+
+class TestRatingsInPlace(unittest.TestCase):
+    """
+    Changes only ratings, so they are written in place.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.storage = StorageBinary(os.path.join(self.directory,
+                                                  "movies.bin"))
+        self.storage.read_movies()
+
+
+    def rating_only(self, title, rating):
+        """
+        Returns {title: attributes} with the attributes of
+        title in self.storage and a new rating.
+        """
+        return {title: dict(self.storage.get(title), rating=rating)}
+
+
+    def test_in_memory_copy_is_patched(self):
+        self.storage.upsert_movies(self.rating_only("Up", 7.5))
+        self.assertEqual(self.storage.read_movies()["Up"]["rating"], 7.5)
+        reopened = StorageBinary(self.storage.file_path)
+        self.assertEqual(reopened.get("Up")["rating"], 7.5)
+
+
+    def test_changes_of_another_instance_are_read(self):
+        other = StorageBinary(self.storage.file_path)
+        other.upsert_movies({"New": {"rating": 6.0, "year": 2020,
+                                     "poster": None}})
+
+        self.storage.upsert_movies(self.rating_only("Up", 7.5))
+        movies = self.storage.read_movies()
+        self.assertEqual(len(movies), self.storage.count())
+        self.assertEqual(movies["Up"]["rating"], 7.5)
+        self.assertIn("New", movies)
+
+        self.storage.upsert_movies(self.rating_only("New", 6.5))
+        self.assertEqual(self.storage.read_movies()["New"]["rating"], 6.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
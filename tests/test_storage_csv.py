@@ -0,0 +1,197 @@
+"""
+Tests for StorageCsv: the journaled mode must give the
+same results as the mode that rewrites the csv file.
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from storage.storage_csv import StorageCsv
+
+
+def random_operations(seed, count):
+    """
+    Returns a list of count operations on a few titles,
+    either ("upsert", {title: attributes}) or
+    ("delete", title), always the same for a seed.
+    """
+    generator = random.Random(seed)
+    titles = [f"Movie {number}" for number in range(20)] + ["Titanic", "Up"]
+    operations = []
+    for _ in range(count):
+        title = generator.choice(titles)
+        if generator.random() < 0.25:
+            operations.append(("delete", title))
+        else:
+            operations.append(("upsert", {title: {
+                "rating": generator.randint(0, 100) / 10,
+                "year": generator.randint(1920, 2024),
+                "poster": generator.choice(["N/A", f"https://p/{title}.jpg"])}}))
+    return operations
+
+
+class TestJournaledCsv(unittest.TestCase):
+    """
+    Runs the same operations on a StorageCsv in each mode,
+    and compares the movies they end up with.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+    def storage(self, name, **options):
+        """
+        Returns a StorageCsv on a new file in the temporary
+        directory.
+        """
+        return StorageCsv(os.path.join(self.directory, name), **options)
+
+
+    @staticmethod
+    def apply(storage, operations):
+        """
+        Applies operations (see random_operations()) to
+        storage, deleting through the menu command.
+        """
+        for operation, argument in operations:
+            if operation == "upsert":
+                storage.upsert_movies(argument)
+            elif storage.get(argument) is not None:
+                with mock.patch("builtins.input", return_value=argument), \
+                        mock.patch("builtins.print"):
+                    storage.delete_movie()
+
+
+    @staticmethod
+    def snapshot(storage):
+        """
+        Returns the movies of storage as a plain dictionary.
+        """
+        return {title: dict(attributes)
+                for title, attributes in storage.read_movies().items()}
+
+
+    def test_same_movies_in_both_modes(self):
+        operations = random_operations(seed=1, count=300)
+        rewritten = self.storage("rewritten.csv")
+        journaled = self.storage("journaled.csv", journaled=True,
+                                 compact_threshold=10 ** 9)
+        self.apply(rewritten, operations)
+        self.apply(journaled, operations)
+
+        self.assertTrue(os.path.exists(journaled.journal_path))
+        self.assertFalse(os.path.exists(rewritten.journal_path))
+        self.assertEqual(self.snapshot(journaled), self.snapshot(rewritten))
+        self.assertEqual(list(journaled.iter_movies()),
+                         list(rewritten.iter_movies()))
+
+
+    def test_journal_is_replayed_when_reopened(self):
+        operations = random_operations(seed=2, count=200)
+        journaled = self.storage("movies.csv", journaled=True,
+                                 compact_threshold=10 ** 9)
+        self.apply(journaled, operations)
+
+        for reopened in (StorageCsv(journaled.file_path),
+                         StorageCsv(journaled.file_path, journaled=True)):
+            self.assertEqual(self.snapshot(reopened), self.snapshot(journaled))
+            self.assertEqual(dict(reopened.iter_movies()),
+                             self.snapshot(journaled))
+
+
+    def test_streaming_order_is_the_order_of_read_movies(self):
+        journaled = self.storage("movies.csv", journaled=True,
+                                 compact_threshold=10 ** 9)
+        self.apply(journaled, [
+            ("upsert", {"New": {"rating": 5.0, "year": 2000,
+                                "poster": "N/A"}}),
+            ("delete", "Titanic"),
+            ("upsert", {"Later": {"rating": 6.0, "year": 2001,
+                                  "poster": "N/A"}}),
+            ("upsert", {"Titanic": {"rating": 7.0, "year": 1997,
+                                    "poster": "N/A"}}),
+            ("delete", "New"),
+            ("upsert", {"New": {"rating": 5.5, "year": 2000,
+                                "poster": "N/A"}}),
+            ("upsert", {"Up": {"rating": 8.0, "year": 2009,
+                               "poster": "N/A"}})])
+
+        expected = ["Up", "The Godfather", "Later", "Titanic", "New"]
+        self.assertEqual(list(StorageCsv(journaled.file_path).read_movies()),
+                         expected)
+        streamed = list(StorageCsv(journaled.file_path).iter_movies())
+        self.assertEqual([title for title, _ in streamed], expected)
+        self.assertEqual(dict(streamed), self.snapshot(journaled))
+
+
+    def test_update_appends_a_single_row(self):
+        journaled = self.storage("movies.csv", journaled=True)
+        journaled.read_movies()
+        with open(journaled.file_path, mode="rb") as handle:
+            csv_content = handle.read()
+
+        with mock.patch("builtins.input", side_effect=["Up", "7.5"]), \
+                mock.patch("builtins.print"):
+            journaled.update_movie()
+
+        with open(journaled.file_path, mode="rb") as handle:
+            self.assertEqual(handle.read(), csv_content)
+        with open(journaled.journal_path, encoding="utf-8") as handle:
+            self.assertEqual(handle.read().splitlines(),
+                             ["set,Up,7.5,2009," + journaled.get("Up")["poster"]])
+        self.assertEqual(StorageCsv(journaled.file_path).get("Up")["rating"],
+                         7.5)
+
+
+    def test_compaction_merges_the_journal(self):
+        operations = random_operations(seed=3, count=300)
+        rewritten = self.storage("rewritten.csv")
+        journaled = self.storage("journaled.csv", journaled=True,
+                                 compact_threshold=512)
+        self.apply(rewritten, operations)
+        self.apply(journaled, operations)
+        journaled.compact()
+
+        self.assertFalse(os.path.exists(journaled.journal_path))
+        with open(journaled.file_path, encoding="utf-8") as journaled_file, \
+                open(rewritten.file_path, encoding="utf-8") as rewritten_file:
+            self.assertEqual(journaled_file.read(), rewritten_file.read())
+
+
+class TestMissingValues(unittest.TestCase):
+    """
+    Movies whose rating, year or poster is None are read
+    back as None, from the csv file and from the journal.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+    def test_missing_values_survive_reopening(self):
+        missing = {"No rating": {"rating": None, "year": 2001,
+                                 "poster": "N/A"},
+                   "No year": {"rating": 6.5, "year": None, "poster": None}}
+        for journaled in (False, True):
+            with self.subTest(journaled=journaled):
+                storage = StorageCsv(
+                    os.path.join(self.directory, f"{journaled}.csv"),
+                    journaled=journaled)
+                storage.upsert_movies(missing)
+                self.assertEqual(os.path.exists(storage.journal_path),
+                                 journaled)
+
+                reopened = StorageCsv(storage.file_path)
+                movies = TestJournaledCsv.snapshot(reopened)
+                self.assertEqual(len(movies), 5)
+                self.assertEqual({title: movies[title] for title in missing},
+                                 missing)
+                self.assertEqual(dict(reopened.iter_movies()), movies)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests for StorageSqlite: movies without a rating or a
+year are stored like in the other storages, also in
+databases created before they could be missing.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from storage.storage_sqlite import StorageSqlite
+
+
+class TestMissingValues(unittest.TestCase):
+    """
+    Stores movies whose rating or year is None.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.file_path = os.path.join(self.directory, "movies.sqlite3")
+
+
+    def test_batch_with_missing_values(self):
+        storage = StorageSqlite(self.file_path)
+        storage.upsert_movies({"X": {"rating": None, "year": None,
+                                     "poster": None},
+                               "Y": {"rating": 5.0, "year": 2001,
+                                     "poster": None}})
+        self.assertEqual(storage.get("X"), {"rating": None, "year": None,
+                                            "poster": None})
+        self.assertEqual(storage.get("Y")["rating"], 5.0)
+        self.assertNotIn("X", [title for title, _
+                               in storage.movies_by_rating()])
+        self.assertEqual(storage.count(), 5)
+
+
+    def test_old_database_accepts_missing_values(self):
+        connection = sqlite3.connect(self.file_path)
+        with connection:
+            connection.execute(
+                "CREATE TABLE movies (title TEXT PRIMARY KEY, "
+                "title_key TEXT NOT NULL, rating REAL NOT NULL, "
+                "year INTEGER NOT NULL, poster TEXT)")
+            connection.executemany(
+                "INSERT INTO movies VALUES (?, ?, ?, ?, ?)",
+                [("B", "b", 7.0, 2000, None), ("A", "a", 8.0, 1990, "p")])
+        connection.close()
+
+        storage = StorageSqlite(self.file_path)
+        storage.upsert_movies({"X": {"rating": None, "year": 1999,
+                                     "poster": None}})
+        self.assertEqual([title for title, _ in storage.iter_movies()],
+                         ["B", "A", "X"])
+        self.assertEqual(storage.find_duplicate("a"), "A")
+        self.assertEqual(storage.get("X")["rating"], None)
+
+
+if __name__ == "__main__":
+    unittest.main()
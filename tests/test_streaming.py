@@ -0,0 +1,150 @@
+"""
+Tests for the streaming readers of StorageJson and
+StorageCsv: peak memory stays flat while streaming a
+large file, and malformed files are rejected.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+from storage.storage_csv import StorageCsv
+from storage.storage_json import StorageJson
+
+MOVIES = 20000
+CHUNK_SIZE = 1024
+
+
+def generate_movies(count):
+    """
+    Returns a dictionary of count movies.
+    """
+    return {f"Movie number {number}": {
+        "rating": number % 100 / 10, "year": 1900 + number % 125,
+        "poster": f"https://m.media-amazon.com/images/M/{number:020d}.jpg"}
+        for number in range(count)}
+
+
+def peak_memory(iterable):
+    """
+    Consumes iterable without keeping its items.
+    Returns a tuple (number of items, peak traced memory).
+    """
+    tracemalloc.start()
+    try:
+        count = 0
+        for _ in iterable:
+            count += 1
+        return count, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestStreamingMemory(unittest.TestCase):
+    """
+    Streams a generated file of MOVIES movies, several
+    megabytes, and checks that the peak memory is a small
+    fraction of its size.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.movies = generate_movies(MOVIES)
+
+
+    def test_json_stream_memory_is_bounded(self):
+        file_path = os.path.join(self.directory, "movies.json")
+        with open(file_path, mode="w", encoding="utf-8") as handle:
+            json.dump(self.movies, handle, indent=4)
+        file_size = os.path.getsize(file_path)
+        del self.movies
+
+        with open(file_path, encoding="utf-8") as handle:
+            count, peak = peak_memory(
+                StorageJson._iter_json_object(handle, chunk_size=CHUNK_SIZE))
+        self.assertEqual(count, MOVIES)
+        self.assertLess(peak, file_size / 20)
+
+
+    def test_csv_stream_memory_is_bounded(self):
+        storage = StorageCsv(os.path.join(self.directory, "movies.csv"))
+        storage.read_movies()
+        storage.upsert_movies(self.movies)
+        file_size = os.path.getsize(storage.file_path)
+        del self.movies
+
+        reopened = StorageCsv(storage.file_path)
+        count, peak = peak_memory(reopened.iter_movies())
+        self.assertEqual(count, MOVIES + 3) # and the example movies
+        self.assertLess(peak, file_size / 20)
+
+
+class TestJsonObjectParser(unittest.TestCase):
+    """
+    Boundary and error cases of StorageJson._iter_json_object().
+    """
+    @staticmethod
+    def parse(text, chunk_size=CHUNK_SIZE):
+        """
+        Returns the list of tuples (key, value) parsed
+        from text.
+        """
+        return list(StorageJson._iter_json_object(io.StringIO(text),
+                                                  chunk_size=chunk_size))
+
+
+    def test_same_result_as_json_load_for_every_chunk_size(self):
+        movies = generate_movies(50)
+        movies["Amélie, \"quoted\" {braces}"] = {"rating": 8.3, "year": 2001,
+                                                 "poster": None}
+        text = json.dumps(movies, indent=4)
+        for chunk_size in (1, 2, 3, 7, 64, len(text) + 1):
+            self.assertEqual(dict(self.parse(text, chunk_size)), movies)
+
+
+    def test_number_cut_at_the_end_of_a_chunk(self):
+        text = '{"a": 12345678, "b": 1.5e10}'
+        for chunk_size in range(1, len(text) + 1):
+            self.assertEqual(self.parse(text, chunk_size),
+                             [("a", 12345678), ("b", 1.5e10)])
+
+
+    def test_empty_object(self):
+        self.assertEqual(self.parse("  {  }  "), [])
+        self.assertEqual(self.parse("{}", chunk_size=1), [])
+
+
+    def test_truncated_object(self):
+        for text in ('{"a": {"rating": 9', '{"a": 1', '{"a": 1,', '{"a"', "{",
+                     ""):
+            with self.subTest(text=text), \
+                    self.assertRaises(json.JSONDecodeError):
+                self.parse(text, chunk_size=2)
+
+
+    def test_trailing_comma(self):
+        with self.assertRaises(json.JSONDecodeError):
+            self.parse('{"a": 1, "b": 2,}')
+        with self.assertRaises(json.JSONDecodeError):
+            self.parse('{"a": 1,\n}', chunk_size=1)
+
+
+    def test_top_level_is_not_an_object(self):
+        for text in ('[{"a": 1}]', '"movies"', "42", "null"):
+            with self.subTest(text=text), \
+                    self.assertRaises(json.JSONDecodeError):
+                self.parse(text)
+
+
+    def test_missing_colon_or_separator(self):
+        for text in ('{"a" 1}', '{"a": 1 "b": 2}', '{1: 2}'):
+            with self.subTest(text=text), \
+                    self.assertRaises(json.JSONDecodeError):
+                self.parse(text)
+
+
+if __name__ == "__main__":
+    unittest.main()
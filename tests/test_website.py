@@ -0,0 +1,139 @@
+"""
+Tests for switching the generated website between a
+single page and pages: each kind removes the files of
+the other one.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import website_generator
+
+MOVIES = [(f"Movie {number}", {"rating": number / 10, "year": 2000 + number,
+                               "poster": "N/A"})
+          for number in range(25)]
+
+
+class TestSwitchingWebsites(unittest.TestCase):
+    """
+    Writes both kinds of website to the same temporary
+    folder, one after the other.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.template_path = os.path.join(self.directory, "template.html")
+        with open(self.template_path, mode="w", encoding="utf-8") as handle:
+            handle.write("<title>__TEMPLATE_TITLE__</title>"
+                         "<ol>__TEMPLATE_MOVIE_GRID__</ol>")
+        self.website_dir = os.path.join(self.directory, "website")
+        os.mkdir(self.website_dir)
+        self.website_path = os.path.join(self.website_dir, "index.html")
+        self.render_cache = website_generator.RenderCache(
+            os.path.join(self.directory, "website_cache.json"))
+
+
+    def write_pages(self):
+        """
+        Writes MOVIES as pages of 10 movies.
+        """
+        return website_generator.write_paginated_website(
+            MOVIES, page_size=10, template_path=self.template_path,
+            website_dir=self.website_dir, workers=1, precompress=True)
+
+
+    def write_single_page(self):
+        """
+        Writes MOVIES as a single page, with a render cache.
+        """
+        return website_generator.write_website(
+            MOVIES, template_path=self.template_path,
+            website_path=self.website_path, render_cache=self.render_cache,
+            data_signature="unchanged", precompress=True)
+
+
+    def files(self):
+        """
+        Returns the sorted names of the files of the website.
+        """
+        return sorted(os.listdir(self.website_dir))
+
+
+    def read_website(self):
+        """
+        Returns the content of index.html.
+        """
+        with open(self.website_path, encoding="utf-8") as handle:
+            return handle.read()
+
+
+    def test_single_page_removes_the_pages(self):
+        self.assertEqual(self.write_pages()["pages"], 3)
+        self.assertIn("page-3.html.gz", self.files())
+        self.assertIn("movies_index.json", self.files())
+
+        self.assertTrue(self.write_single_page()["written"])
+        self.assertEqual(self.files(), ["index.html", "index.html.gz"])
+        self.assertIn("Movie 24", self.read_website())
+
+
+    def test_pages_replace_the_cached_single_page(self):
+        self.write_single_page()
+        single_page = self.read_website()
+        self.assertFalse(self.write_single_page()["written"])
+
+        self.write_pages()
+        self.assertNotEqual(self.read_website(), single_page)
+        # the render cache sees index.html was replaced
+        self.assertTrue(self.write_single_page()["written"])
+        self.assertEqual(self.read_website(), single_page)
+        self.assertEqual(self.files(), ["index.html", "index.html.gz"])
+
+
+class TestMoviesIndex(unittest.TestCase):
+    """
+    The json index of a paginated website, with movies
+    missing a rating or a year.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+    def test_missing_values_are_sorted_last(self):
+        movies = [["B", None, 7.0, 1], ["a", 2001, None, 1],
+                  ["C", 1999, 9.5, 1], ["d", None, None, 2]]
+        file_path = os.path.join(self.directory, "movies_index.json")
+        website_generator._write_movies_index(file_path, 3, 2, movies)
+        with open(file_path, encoding="utf-8") as handle:
+            index = json.load(handle)
+        self.assertEqual(index["movies"], movies)
+        self.assertEqual(index["by_title"], [1, 0, 2, 3])
+        self.assertEqual(index["by_year"], [2, 1, 0, 3])
+        self.assertEqual(index["by_rating"], [2, 0, 1, 3])
+
+
+    def test_paginated_website_with_missing_values(self):
+        template_path = os.path.join(self.directory, "template.html")
+        with open(template_path, mode="w", encoding="utf-8") as handle:
+            handle.write("<ol>__TEMPLATE_MOVIE_GRID__</ol>")
+        movies = MOVIES + [("No rating", {"rating": None, "year": 2001,
+                                          "poster": None}),
+                           ("No year", {"rating": 5.0, "year": None,
+                                        "poster": None})]
+        report = website_generator.write_paginated_website(
+            movies, page_size=10, template_path=template_path,
+            website_dir=self.directory, workers=1)
+        self.assertEqual(report, {"cards": 27, "pages": 3})
+        with open(os.path.join(self.directory, "movies_index.json"),
+                  encoding="utf-8") as handle:
+            index = json.load(handle)
+        self.assertEqual(index["movies"][index["by_rating"][-1]][0],
+                         "No rating")
+        self.assertEqual(index["movies"][index["by_year"][-1]][0], "No year")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,476 @@
+"""
+A module for rendering the movies of a storage into the
+HTML website, _static/index.html, from the template
+_static/index_template.html.
+
+The template is split once at the movie grid
+placeholder into a header and a footer, and the page is
+streamed to the file: the header, one movie card at a
+time, then the footer, through a buffered writer. The
+whole page is never held in memory, and the time to
+render it grows linearly with the number of movies.
+
+A render cache (data/website_cache.json) remembers
+what the last page was made of, so the page is only
+replaced when it changes:
+- when neither the database nor the template changed
+since the last page, nothing is rendered at all
+- otherwise the new page is rendered next to the old
+one, and replaces it only if its hash is different, so
+a change that doesn't show on the page (a rating)
+leaves the old page untouched
+Rendering a card costs less than hashing its title,
+year and poster, or even comparing them with the ones
+of a cache of cards by title, so a card is rendered
+again rather than looked up in a cache of cards.
+This means a change that shows on the page renders,
+hashes and writes every card again, about 0.4 seconds
+for 200,000 movies, not milliseconds.
+
+For large databases, write_paginated_website() splits
+the movies into pages of a fixed number of cards,
+rendered in parallel by a pool of processes, with an
+index page linking to them and a json index of every
+movie (title, year, rating and page) sorted in advance
+by title, year and rating, for searching and sorting
+without opening the pages. Only a few pages are held in
+memory at once, but the json index is built in memory,
+a short entry per movie, to be sorted.
+
+Both kinds of website are written to _static/index.html,
+and each one removes the files only the other one has,
+so switching between them leaves no stale pages.
+"""
+
+import os
+import re
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import static_assets
+from file_utils import AtomicWriter, file_signature, save_json, \
+    write_atomically
+
+TEMPLATE_PATH = os.path.join("_static", "index_template.html")
+WEBSITE_PATH = os.path.join("_static", "index.html")
+WEBSITE_TITLE = "MS Movie App"
+PLACEHOLDER_TITLE = "__TEMPLATE_TITLE__"
+PLACEHOLDER_MOVIES = "__TEMPLATE_MOVIE_GRID__"
+STYLESHEET_NAME = "style.css" # as the template links it
+RENDER_CACHE_PATH = os.path.join("data", "website_cache.json")
+BUFFER_SIZE = 256 * 1024 # bytes written to the file at once
+PAGE_SIZE = 500 # cards per page of a paginated website
+MOVIES_INDEX_NAME = "movies_index.json"
+
+
+def render_card(title, attributes):
+    """
+    Returns the HTML of the card of a movie, a list item
+    with its poster, title and year.
+    """
+    return f"""<li>
+                <div class="movie">
+                    <img class="movie-poster" src="{attributes.get("poster")}" alt="{title}"/>
+                    <div class="movie-title"> {title} </div>
+                    <div class="movie-year"> {attributes.get("year")} </div>
+                </div>
+            </li>"""
+
+
+def split_template(template, website_title=WEBSITE_TITLE, stylesheet=None):
+    """
+    Fills in the title of the template, links it to
+    stylesheet (a fingerprinted name of style.css, see
+    static_assets) if given, and splits it at the movie
+    grid placeholder.
+    Returns a tuple (header, footer), the HTML before and
+    after the movie cards.
+    """
+    template = template.replace(PLACEHOLDER_TITLE, website_title)
+    if stylesheet is not None:
+        template = template.replace(f'href="{STYLESHEET_NAME}"',
+                                    f'href="{stylesheet}"')
+    header, _, footer = template.partition(PLACEHOLDER_MOVIES)
+    return header, footer
+
+
+def with_local_posters(movies, posters):
+    """
+    Yields the tuples (title, attributes) of movies, with
+    the poster replaced by its local copy when posters,
+    a dictionary where keys = poster URLs, values = paths
+    of their local copies (see poster_mirror), has one.
+    """
+    for title, attributes in movies:
+        local_poster = posters.get(attributes.get("poster"))
+        if local_poster is not None:
+            attributes = dict(attributes, poster=local_poster)
+        yield title, attributes
+
+
+class RenderCache:
+    """
+    What the last generated website was made of, stored
+    in a json file:
+    - "template": the hash of the template and title
+    - "data": the data_signature() of the storage it was
+    generated from
+    - "page": the hash of the page
+    - "website": the signature [mtime, size] of the page
+    when it was written, so a page changed since then is
+    written again
+    - "count": the number of movies in the page
+    """
+    def __init__(self, file_path=RENDER_CACHE_PATH):
+        self.file_path = file_path
+        self.template_hash = None
+        self.data_signature = None
+        self.page_hash = None
+        self.website_signature = None
+        self.count = 0
+
+
+    def load(self):
+        """
+        Loads the cache from its file.
+        Handles missing or corrupted files as an empty
+        cache.
+        """
+        try:
+            with open(self.file_path, mode="r", encoding="utf-8") as handle:
+                saved = json.load(handle)
+            self.template_hash = saved["template"]
+            self.data_signature = saved["data"]
+            self.page_hash = saved["page"]
+            self.website_signature = (None if saved["website"] is None
+                                      else tuple(saved["website"]))
+            self.count = int(saved["count"])
+        except (FileNotFoundError, json.JSONDecodeError,
+                KeyError, TypeError, ValueError):
+            self.__init__(self.file_path)
+
+
+    def save(self):
+        """
+        Writes the cache to its file.
+        """
+        try:
+            save_json(self.file_path, {"template": self.template_hash,
+                                       "data": self.data_signature,
+                                       "page": self.page_hash,
+                                       "website": self.website_signature,
+                                       "count": self.count})
+        except OSError as e:
+            print(f"Render cache wasn't saved: {e}")
+
+
+def write_website(movies, template_path=TEMPLATE_PATH,
+                  website_path=WEBSITE_PATH, website_title=WEBSITE_TITLE,
+                  render_cache=None, data_signature=None, posters=None,
+                  stylesheet=None, precompress=False):
+    """
+    Renders movies, an iterable of tuples
+    (title, attributes) like IStorage.iter_movies(), into
+    website_path, streaming one card at a time.
+
+    With a render_cache (a RenderCache), the page at
+    website_path is only replaced when the new one is
+    different. data_signature, the data_signature() of
+    the storage of the movies, lets it tell that nothing
+    changed without rendering movies.
+
+    With posters (see with_local_posters()), the cards
+    show the local copies of the posters. data_signature
+    must then change when they change.
+
+    The page links to stylesheet when given (see
+    split_template()). With precompress, the page gets
+    an up to date gzip variant (see static_assets).
+
+    The new page is written next to the old one, and
+    replaces it when it is complete. The pages and the
+    json index of a paginated website in the same folder
+    are removed.
+
+    Returns a dictionary with the number of "cards" in
+    the website and whether the website was "written".
+    """
+    with open(template_path, "r", encoding="utf-8") as handle:
+        template = handle.read()
+    header, footer = split_template(template, website_title, stylesheet)
+    template_hash = hashlib.sha256(
+        f"{template}\0{website_title}\0{stylesheet}".encode("utf-8")
+    ).hexdigest()
+    if data_signature is not None:
+        data_signature = str(data_signature)
+    _remove_paginated_website(os.path.dirname(website_path) or ".")
+
+    if posters:
+        movies = with_local_posters(movies, posters)
+    old_page_hash = None
+    if render_cache is not None:
+        render_cache.load()
+        website_signature = file_signature(website_path)
+        if (website_signature is not None
+                and render_cache.website_signature == website_signature):
+            if (data_signature is not None
+                    and render_cache.data_signature == data_signature
+                    and render_cache.template_hash == template_hash):
+                if precompress and not static_assets.is_precompressed(
+                        website_path):
+                    static_assets.precompress(website_path)
+                return {"cards": render_cache.count, "written": False}
+            old_page_hash = render_cache.page_hash
+
+    page_hash = hashlib.blake2b(digest_size=16)
+    count = 0
+    writer = AtomicWriter(website_path)
+    with writer as page:
+        # cards are joined into chunks of about BUFFER_SIZE
+        # bytes, each one hashed and written at once
+        chunk, chunk_size = [header], len(header)
+        for title, attributes in movies:
+            card = render_card(title, attributes)
+            chunk.append(card)
+            chunk_size += len(card)
+            count += 1
+            if chunk_size >= BUFFER_SIZE:
+                data = "".join(chunk).encode("utf-8")
+                page_hash.update(data)
+                page.write(data)
+                chunk, chunk_size = [], 0
+        chunk.append(footer)
+        data = "".join(chunk).encode("utf-8")
+        page_hash.update(data)
+        page.write(data)
+
+        page_hash = page_hash.hexdigest()
+        written = page_hash != old_page_hash
+        if not written:
+            writer.discard()
+
+    if render_cache is not None:
+        render_cache.template_hash = template_hash
+        render_cache.data_signature = data_signature
+        render_cache.page_hash = page_hash
+        render_cache.website_signature = file_signature(website_path)
+        render_cache.count = count
+        render_cache.save()
+    if precompress and not static_assets.is_precompressed(website_path):
+        static_assets.precompress(website_path)
+    return {"cards": count, "written": written}
+
+
+####### Paginated website
+
+def page_name(page_number):
+    """
+    Returns the file name of a page of a paginated
+    website, counting from 1.
+    """
+    return f"page-{page_number}.html"
+
+
+def _write_file(file_path, content, precompress=False):
+    """
+    Writes content (bytes) to file_path without ever
+    leaving it half written (see file_utils). With
+    precompress, writes its gzip variant too.
+    """
+    write_atomically(file_path, content)
+    if precompress:
+        static_assets.precompress(file_path)
+
+
+def _render_navigation(page_number, is_last_page):
+    """
+    Returns the list item with the links to the previous
+    page, the index page and the next page.
+    """
+    links = []
+    if page_number > 1:
+        links.append(f'<a href="{page_name(page_number - 1)}">Previous</a>')
+    links.append('<a href="index.html">All pages</a>')
+    if not is_last_page:
+        links.append(f'<a href="{page_name(page_number + 1)}">Next</a>')
+    return f"""<li class="page-nav">
+                {" | ".join(links)}
+            </li>"""
+
+
+def _write_page(file_path, header, footer, movies, navigation,
+                precompress=False):
+    """
+    Renders a page of a paginated website, with the cards
+    of movies, a list of tuples (title, attributes),
+    followed by navigation, and writes it to file_path,
+    with its gzip variant when precompress is True.
+    Runs in the worker processes.
+    Returns the number of cards in the page.
+    """
+    cards = [render_card(title, attributes) for title, attributes in movies]
+    cards.append(navigation)
+    _write_file(file_path, "".join(
+        [header, *cards, footer]).encode("utf-8"), precompress)
+    return len(movies)
+
+
+def _write_movies_index(file_path, page_size, page_count, movies,
+                        precompress=False):
+    """
+    Writes the json index of a paginated website:
+        {"page_size": 500, "pages": 3,
+         "fields": ["title", "year", "rating", "page"],
+         "movies": [["Titanic", 1999, 9.0, 1], ...],
+         "by_title": [...], "by_year": [...],
+         "by_rating": [...]}
+    where "by_..." are the positions in "movies" sorted by
+    title (ignoring upper and lower case), by year, and by
+    rating from the highest, the orders a page would
+    otherwise have to sort. Movies without a year or a
+    rating (None) come last in those orders.
+    """
+    def year_key(position):
+        year = movies[position][1]
+        return year is None, year or 0
+
+    def rating_key(position):
+        rating = movies[position][2]
+        return rating is None, -(rating or 0)
+
+    positions = range(len(movies))
+    content = {
+        "page_size": page_size,
+        "pages": page_count,
+        "fields": ["title", "year", "rating", "page"],
+        "movies": movies,
+        "by_title": sorted(positions,
+                           key=lambda position: movies[position][0].lower()),
+        "by_year": sorted(positions, key=year_key),
+        "by_rating": sorted(positions, key=rating_key),
+    }
+    _write_file(file_path, json.dumps(
+        content, separators=(",", ":")).encode("utf-8"), precompress)
+
+
+def _remove_stale_pages(website_dir, page_count):
+    """
+    Removes the pages left from a previous website with
+    more pages than page_count, and their gzip variants.
+    """
+    for file_name in os.listdir(website_dir):
+        match = re.fullmatch(r"page-(\d+)\.html(\.gz)?", file_name)
+        if match and int(match.group(1)) > page_count:
+            os.remove(os.path.join(website_dir, file_name))
+
+
+def _remove_paginated_website(website_dir):
+    """
+    Removes the pages and the json index of a paginated
+    website in website_dir, and their gzip variants, when
+    there are any.
+    """
+    if not os.path.isdir(website_dir):
+        return
+    _remove_stale_pages(website_dir, 0)
+    for file_name in (MOVIES_INDEX_NAME, MOVIES_INDEX_NAME + ".gz"):
+        file_path = os.path.join(website_dir, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def write_paginated_website(movies, page_size=PAGE_SIZE,
+                            template_path=TEMPLATE_PATH,
+                            website_dir=os.path.dirname(WEBSITE_PATH),
+                            website_title=WEBSITE_TITLE, workers=None,
+                            posters=None, stylesheet=None, precompress=False):
+    """
+    Renders movies, an iterable of tuples
+    (title, attributes) like IStorage.iter_movies(), into
+    pages of page_size cards in website_dir:
+    page-1.html, page-2.html, ..., an index.html linking
+    to every page, and the json index movies_index.json.
+
+    Pages are rendered and written by a pool of workers
+    processes (by default, one per CPU) as soon as they
+    are full, and at most two pages per worker wait in
+    memory, whatever the number of movies. The json index
+    is kept in memory until the end, a list
+    [title, year, rating, page] per movie, so the memory
+    used still grows with the number of movies.
+
+    Every file is written next to the old one, and
+    replaces it when complete. With posters (see with_local_posters()),
+    the cards show the local copies of the posters. The
+    pages link to stylesheet when given (see
+    split_template()), and with precompress every file
+    gets a gzip variant (see static_assets). index.html
+    replaces the page of write_website(), whose render
+    cache then sees it was changed.
+
+    Returns a dictionary with the number of "cards" and
+    the number of "pages".
+    """
+    with open(template_path, "r", encoding="utf-8") as handle:
+        template = handle.read()
+    os.makedirs(website_dir, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    if posters:
+        movies = with_local_posters(movies, posters)
+    index_entries = []
+    movies_index = []
+    pending = deque()
+    count = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit_page(page_movies, is_last_page):
+            page_number = len(index_entries) + 1
+            header, footer = split_template(
+                template, f"{website_title} - page {page_number}", stylesheet)
+            pending.append(executor.submit(
+                _write_page,
+                os.path.join(website_dir, page_name(page_number)),
+                header, footer, page_movies,
+                _render_navigation(page_number, is_last_page), precompress))
+            index_entries.append((page_number, page_movies[0][0],
+                                  page_movies[-1][0]))
+            while len(pending) > 2 * workers:
+                pending.popleft().result()
+
+        # a full page is held back until the next movie
+        # comes, to know whether it is the last one
+        page_movies, full_page = [], None
+        for title, attributes in movies:
+            if full_page is not None:
+                submit_page(full_page, is_last_page=False)
+                full_page = None
+            page_movies.append((title, attributes))
+            movies_index.append([title, attributes["year"],
+                                 attributes["rating"],
+                                 count // page_size + 1])
+            count += 1
+            if len(page_movies) == page_size:
+                full_page, page_movies = page_movies, []
+        if full_page is not None:
+            submit_page(full_page, is_last_page=not page_movies)
+        if page_movies:
+            submit_page(page_movies, is_last_page=True)
+        for future in pending:
+            future.result()
+
+    header, footer = split_template(template, website_title, stylesheet)
+    links = "".join(
+        f"""<li class="page-link">
+                <a href="{page_name(page_number)}">Page {page_number}</a>
+                <div class="movie-year"> {first_title} - {last_title} </div>
+            </li>"""
+        for page_number, first_title, last_title in index_entries)
+    _write_file(os.path.join(website_dir, "index.html"),
+                      (header + links + footer).encode("utf-8"), precompress)
+    _write_movies_index(os.path.join(website_dir, MOVIES_INDEX_NAME),
+                        page_size, len(index_entries), movies_index,
+                        precompress)
+    _remove_stale_pages(website_dir, len(index_entries))
+    return {"cards": count, "pages": len(index_entries)}